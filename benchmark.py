@@ -0,0 +1,184 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import platform
+import resource
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+import numpy as np
+
+import preprocess
+import index
+
+
+CLASSES = ['NonPositionalPosting', 'PositionalPosting', 'PositionalGraph']
+KINDS = ['plain', 'quoted', 'wildcard']
+SYLLABLES = [c + v for c in 'bdfgklmnprstvz' for v in 'aeiou']
+
+# metrics where lower is better, the rest (throughputs) are better higher
+LOWER = ['index_seconds', 'peak_rss_mb', 'index_rss_mb', 'dump_seconds', 'dump_mb', 'save_seconds', 'save_mb'] + [
+    f'{kind}_{percentile}_ms' for kind in KINDS for percentile in ['p50', 'p95', 'p99']
+]
+HIGHER = ['docs_per_second', 'tokens_per_second']
+
+
+def vocabulary(size, seed=0):  # pronounceable made-up words, kept only if preprocessing leaves them as they are
+    rng = np.random.default_rng(seed)
+    words = {}
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+        if preprocess.normalize(word) == word:
+            words[word] = None
+    return list(words)
+
+
+def corpus(n_docs, vocabulary_size=20000, exponent=1.1, mean_length=80, seed=0):  # docs with Zipfian term frequencies
+    rng = np.random.default_rng(seed)
+    words = np.asarray(vocabulary(vocabulary_size, seed=seed), dtype='object')
+    probabilities = 1 / np.arange(1, len(words) + 1) ** exponent
+    lengths = rng.poisson(mean_length, size=n_docs) + 1
+    tokens = words[rng.choice(len(words), size=lengths.sum(), p=probabilities / probabilities.sum())]
+    return [tokens[stop-length:stop].tolist() for stop, length in zip(np.cumsum(lengths), lengths)]
+
+
+def queries(documents, n, kind, seed=0):  # queries drawn from the docs, so that they have answers
+    rng = np.random.default_rng(seed)
+    generated = []
+    while len(generated) < n:
+        document = documents[rng.integers(len(documents))]
+        if kind == 'plain':
+            generated.append(rng.choice(document, size=min(2, len(document)), replace=False).tolist())
+        elif kind == 'quoted' and len(document) > 1:
+            i = rng.integers(len(document) - 1)
+            generated.append(['"' + document[i], document[i+1] + '"'])
+        elif kind == 'wildcard':
+            term = document[rng.integers(len(document))]
+            generated.append([term[:max(2, len(term)//2)] + '*'])
+    return generated
+
+
+def peak_rss():  # in MB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes on macOS, KB on Linux
+
+
+def size(path):  # in MB, of a file or of all files under a directory
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2**20
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2**20
+
+
+def measure(name, n_docs, n_queries=200, k=10, seed=0, vocabulary_size=20000):  # one class on one corpus size
+    documents = corpus(n_docs, vocabulary_size=vocabulary_size, seed=seed)
+    workload = {kind: queries(documents, n_queries, kind, seed=seed) for kind in KINDS}
+    n_tokens = sum(map(len, documents))
+    baseline = peak_rss()
+
+    result = {'class': name, 'n_docs': n_docs, 'n_tokens': n_tokens}
+    start = time.perf_counter()
+    built = getattr(index, name)()
+    built.add_documents(documents)
+    built.matrix  # the scoring matrix is part of building, not of the first query
+    result['index_seconds'] = time.perf_counter() - start
+    result['docs_per_second'] = n_docs / result['index_seconds']
+    result['tokens_per_second'] = n_tokens / result['index_seconds']
+    result['peak_rss_mb'] = peak_rss()
+    result['index_rss_mb'] = result['peak_rss_mb'] - baseline
+
+    for kind, kind_queries in workload.items():
+        latencies = []
+        for query in kind_queries:
+            start = time.perf_counter()
+            built.search(query, k=k)
+            latencies.append(time.perf_counter() - start)
+        for percentile, value in zip(['p50', 'p95', 'p99'], np.percentile(latencies, [50, 95, 99])):
+            result[f'{kind}_{percentile}_ms'] = 1000 * value
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, name + '.json')
+        start = time.perf_counter()
+        built.dump(path)
+        result['dump_seconds'] = time.perf_counter() - start
+        result['dump_mb'] = size(path)
+
+        path = os.path.join(directory, name)
+        start = time.perf_counter()
+        built.save(path)
+        result['save_seconds'] = time.perf_counter() - start
+        result['save_mb'] = size(path)
+    finally:
+        shutil.rmtree(directory)
+    return result
+
+
+def run(sizes=(1000, 5000), classes=CLASSES, n_queries=200, k=10, seed=0, vocabulary_size=20000):
+    results = []
+    for n_docs in sizes:
+        for name in classes:
+            # a fresh process for each run, so that the peak RSS is its own
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(
+                    measure, name, n_docs, n_queries=n_queries, k=k, seed=seed, vocabulary_size=vocabulary_size
+                ).result()
+            results.append(result)
+            print(f"{name:<20} {n_docs:>7} docs | {result['docs_per_second']:>9.0f} docs/s | "
+                  f"{result['peak_rss_mb']:>7.1f} MB peak | p50 " +
+                  ' '.join(f"{kind} {result[f'{kind}_p50_ms']:.2f}ms" for kind in KINDS), flush=True)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed, 'n_queries': n_queries, 'k': k, 'vocabulary_size': vocabulary_size,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2):  # metrics which got worse by more than 'tolerance' (a ratio)
+    old = {(result['class'], result['n_docs']): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = old.get((result['class'], result['n_docs']))
+        if before is None:
+            continue
+        for metric in LOWER + HIGHER:
+            a, b = before.get(metric), result.get(metric)
+            if a is None or b is None:
+                continue
+            if (metric in LOWER and b > a * (1 + tolerance)) or (metric in HIGHER and b < a * (1 - tolerance)):
+                regressions.append((result['class'], result['n_docs'], metric, a, b))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks indexing, querying and persistence on a synthetic corpus.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000], help='corpus sizes, in docs')
+    parser.add_argument('--classes', nargs='+', default=CLASSES, help='index classes to benchmark')
+    parser.add_argument('--queries', type=int, default=200, help='queries of each kind')
+    parser.add_argument('-k', type=int, default=10, help='results per query')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--vocabulary', type=int, default=20000, help='number of distinct terms')
+    parser.add_argument('--output', default='benchmark.json', help='where the results are written')
+    parser.add_argument('--compare', help='results of an earlier run, to report the regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change allowed before a regression')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.classes, n_queries=args.queries, k=args.k, seed=args.seed, vocabulary_size=args.vocabulary)
+    with open(args.output, 'w') as handler:
+        json.dump(results, handler, indent=4)
+    print('Results written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as handler:
+            regressions = compare(json.load(handler), results, tolerance=args.tolerance)
+        for name, n_docs, metric, before, after in regressions:
+            print(f'Regression: {name} ({n_docs} docs) {metric}: {before:.4g} -> {after:.4g}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
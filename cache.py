@@ -0,0 +1,81 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'invalidations', 'size', 'maxsize', 'hit_rate'])
+
+
+class QueryCache:  # LRU of query results, an entry is only valid for the index generation it was computed on
+    def __init__(self, maxsize=1024, ttl=None):  # ttl: seconds an entry lives, None keeps it until evicted
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (generation, expiry, result)
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.lock = threading.Lock()  # searches share the cache between threads
+
+    def __len__(self): return len(self.data)
+
+    def get(self, key, generation):
+        with self.lock:
+            return self._get(key, generation)
+
+    def _get(self, key, generation):
+        entry = self.data.get(key)
+        if entry is not None:
+            if entry[0] == generation and (entry[1] is None or time.monotonic() < entry[1]):
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            del self.data[key]  # computed on an older index, or expired
+            self.invalidations += 1
+        self.misses += 1
+
+    def put(self, key, generation, result):
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.data[key] = (generation, expiry, result)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def info(self):
+        total = self.hits + self.misses
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.invalidations,
+            len(self.data), self.maxsize, self.hits / total if total else 0.0
+        )
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def freeze(query):  # a hashable key out of a normalized query, phrases become tuples
+    return tuple(tuple(term) if isinstance(term, list) else term for term in query)
+
+
+if __name__ == "__main__":
+    cache = QueryCache(maxsize=2)
+    generation = 0
+
+    for query in [['hello'], ['world'], ['hello'], ['my', 'dear'], ['world']]:
+        key = freeze(query)
+        if cache.get(key, generation) is None:
+            cache.put(key, generation, {'result of': query})
+
+    generation += 1  # the index has changed
+    cache.get(freeze(['world']), generation)
+    print(cache.info())
@@ -0,0 +1,240 @@
+from collections.abc import Mapping, MutableMapping
+from collections import Counter
+from itertools import repeat
+from array import array
+import bisect
+import types
+import sys
+import numpy as np
+
+
+DOC_ID = 'I'  # uint32, like the doc columns of a segment
+NUMBER = 'I'  # term-ids, positions, counts and offsets
+
+
+class Vocabulary:  # interns every term once: term <-> term-id
+    def __init__(self):
+        self.ids = {}
+        self.terms = []
+
+    def __len__(self): return len(self.terms)
+
+    def __contains__(self, term): return term in self.ids
+
+    def intern(self, term):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def encode(self, terms):
+        return array(NUMBER, map(self.intern, terms))
+
+    def decode(self, term_ids):
+        return [self.terms[term_id] for term_id in term_ids]
+
+
+class Documents(MutableMapping):  # doc-id -> term-id array, handed out as the list of its terms
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.data = {}
+
+    def __contains__(self, doc_id): return doc_id in self.data
+
+    def __getitem__(self, doc_id): return self.vocabulary.decode(self.data[doc_id])
+
+    def __setitem__(self, doc_id, document): self.data[doc_id] = self.vocabulary.encode(document)
+
+    def __delitem__(self, doc_id): del self.data[doc_id]
+
+    def __iter__(self): return iter(self.data)
+
+    def __len__(self): return len(self.data)
+
+
+class Frequencies(MutableMapping):  # the forward index of Statistics: doc-id -> Counter, kept as one array of term-ids then counts
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.data = {}
+
+    def __contains__(self, doc_id): return doc_id in self.data
+
+    def __getitem__(self, doc_id):
+        numbers = self.data[doc_id]
+        n = len(numbers) // 2
+        return Counter(dict(zip(self.vocabulary.decode(numbers[:n]), numbers[n:])))
+
+    def __setitem__(self, doc_id, frequencies):
+        self.data[doc_id] = self.vocabulary.encode(frequencies.keys()) + array(NUMBER, frequencies.values())
+
+    def __delitem__(self, doc_id): del self.data[doc_id]
+
+    def __iter__(self): return iter(self.data)
+
+    def __len__(self): return len(self.data)
+
+
+class Postings(Mapping):  # doc-id -> frequency of the term, both kept in flat arrays sorted by doc-id
+    __slots__ = ('doc_ids', 'counts')
+
+    def __init__(self, doc_ids=(), counts=()):
+        self.doc_ids = array(DOC_ID, doc_ids)
+        self.counts = array(NUMBER, counts)
+
+    def _find(self, doc_id):
+        i = len(self.doc_ids) - 1
+        if i < 0 or self.doc_ids[i] != doc_id:  # docs mostly come in order, so the last one is checked first
+            i = bisect.bisect_left(self.doc_ids, doc_id)
+        return i, i < len(self.doc_ids) and self.doc_ids[i] == doc_id
+
+    def add(self, doc_id, count=1):
+        if not self.doc_ids or doc_id > self.doc_ids[-1]:  # a new last doc, the usual case
+            self.doc_ids.append(doc_id)
+            self.counts.append(count)
+            return
+
+        i, found = self._find(doc_id)
+        if found:
+            self.counts[i] += count
+        else:
+            self.doc_ids.insert(i, doc_id)
+            self.counts.insert(i, count)
+
+    def remove(self, doc_id):
+        i, found = self._find(doc_id)
+        if not found:
+            raise KeyError(doc_id)
+        del self.doc_ids[i], self.counts[i]
+
+    def extend(self, other):  # the doc-ids of 'other' must all come after ours
+        self.doc_ids.extend(other.doc_ids)
+        self.counts.extend(other.counts)
+
+    def occurrences(self):  # doc-ids repeated once per occurrence, like the lists of NonPositionalPosting
+        for doc_id, count in zip(self.doc_ids, self.counts):
+            yield from repeat(doc_id, count)
+
+    @property
+    def nbytes(self):
+        return self.doc_ids.itemsize*len(self.doc_ids) + self.counts.itemsize*len(self.counts)
+
+    def __getitem__(self, doc_id):
+        i, found = self._find(doc_id)
+        if not found:
+            raise KeyError(doc_id)
+        return self.counts[i]
+
+    def __iter__(self): return iter(self.doc_ids)
+
+    def __len__(self): return len(self.doc_ids)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.doc_ids.tolist()}, {self.counts.tolist()})'
+
+
+class PositionalPostings(Mapping):  # doc-id -> positions, the positions of all docs share one array
+    __slots__ = ('doc_ids', 'offsets', 'positions')
+
+    def __init__(self, doc_ids=(), offsets=(0,), positions=()):
+        self.doc_ids = array(DOC_ID, doc_ids)
+        self.offsets = array(NUMBER, offsets)  # positions of the i-th doc are positions[offsets[i]:offsets[i+1]]
+        self.positions = array(NUMBER, positions)
+
+    _find = Postings._find
+
+    def add(self, doc_id, position):  # positions of a doc must be added in order
+        if not self.doc_ids or doc_id > self.doc_ids[-1]:  # a new last doc, the usual case
+            self.doc_ids.append(doc_id)
+            self.offsets.append(self.offsets[-1])
+        if doc_id == self.doc_ids[-1]:
+            self.positions.append(position)
+            self.offsets[-1] += 1
+            return
+
+        i, found = self._find(doc_id)
+        if not found:
+            self.doc_ids.insert(i, doc_id)
+            self.offsets.insert(i, self.offsets[i])
+        self.positions.insert(self.offsets[i+1], position)
+        for j in range(i+1, len(self.offsets)):
+            self.offsets[j] += 1
+
+    def remove(self, doc_id):
+        i, found = self._find(doc_id)
+        if not found:
+            raise KeyError(doc_id)
+        start, stop = self.offsets[i], self.offsets[i+1]
+        del self.positions[start:stop], self.doc_ids[i], self.offsets[i+1]
+        for j in range(i+1, len(self.offsets)):
+            self.offsets[j] -= stop - start
+
+    def extend(self, other):  # the doc-ids of 'other' must all come after ours
+        base = len(self.positions)
+        self.doc_ids.extend(other.doc_ids)
+        self.offsets.extend(offset + base for offset in other.offsets[1:])
+        self.positions.extend(other.positions)
+
+    @property
+    def nbytes(self):
+        return sum(numbers.itemsize*len(numbers) for numbers in (self.doc_ids, self.offsets, self.positions))
+
+    def __getitem__(self, doc_id):
+        i, found = self._find(doc_id)
+        if not found:
+            raise KeyError(doc_id)
+        return self.positions[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self): return iter(self.doc_ids)
+
+    def __len__(self): return len(self.doc_ids)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict((doc_id, self[doc_id].tolist()) for doc_id in self)})'
+
+
+def sizeof(obj, seen=None):  # deep size in bytes, objects in 'seen' (or shared) are counted once
+    seen = set() if seen is None else seen
+    stack, size = [obj], 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue  # code is not data, and a loader would lead back to the whole index
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, array, np.ndarray)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
+
+
+if __name__ == "__main__":
+    documents = [
+        ['hello', 'world'],
+        ['hello', 'my', 'dear'],
+        ['what', 'on', 'world', 'is', 'going', 'on']
+    ]
+
+    vocabulary = Vocabulary()
+    docs = Documents(vocabulary)
+    postings, positional = {}, {}
+    for doc_id, document in enumerate(documents, start=1):
+        docs[doc_id] = document
+        for position, term in enumerate(document):
+            postings.setdefault(term, Postings()).add(doc_id)
+            positional.setdefault(term, PositionalPostings()).add(doc_id, position)
+
+    print('Vocabulary:', vocabulary.ids)
+    print('Doc 3:', docs.data[3], '->', docs[3])
+    print('on:', postings['on'], '|', positional['on'])
+    print('Bytes of the postings of <on>:', postings['on'].nbytes, '| with the objects:', sizeof(postings['on']))
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def binary(number, prefix=False):
     binarized = bin(number)
     if prefix:
@@ -14,25 +17,326 @@ def gamma(number):
     offset = number_b[1:]
     return unary(len(offset)) + offset
 
+def delta(number):
+    if number == 0:
+        return None
+    number_b = binary(number)
+    return gamma(len(number_b)) + number_b[1:]
+
 def variable_byte(number, n=8):
-    np = n-1
-    result = ''
+    payload = n-1  # the first bit of each pack is the continuation flag
     number_b = binary(number)
-    n_packs = (len(number_b) // n) + 1
+    n_packs = max(1, -(-len(number_b) // payload))
+    number_b = format(number_b, f'0>{n_packs*payload}')
+    result = ''
     for i in range(n_packs):
-        pack = format(number_b[i*np : (i+1)*np], f'0>{np}')
+        pack = number_b[i*payload : (i+1)*payload]
         is_last_iter = i == n_packs-1
         if is_last_iter:
-            result = '1' + pack + result
+            result = result + '1' + pack
         else:
-            result = '0' + pack + result
+            result = result + '0' + pack
     return result
 
 def get_size(x):
     if isinstance(x, int):
         return x.bit_length()
-    elif isinstance(x, (str, bytes)):
+    elif isinstance(x, str):
         return len(x)
+    elif isinstance(x, (CompressedList, PackedList)):
+        return x.nbytes * 8
+    elif isinstance(x, bytes):
+        return len(x) * 8
+
+
+def to_gaps(numbers):  # sorted numbers -> differences with the previous one (the first is kept as it is)
+    numbers = np.asarray(numbers, dtype='uint64')
+    return np.diff(numbers, prepend=np.zeros(1, dtype='uint64'))
+
+def from_gaps(gaps, base=0):
+    return np.cumsum(np.asarray(gaps, dtype='uint64')) + np.uint64(base)
+
+
+def _pack_bits(bits):  # '0'/'1' string -> bytes (zero padded)
+    return np.packbits(np.frombuffer(bits.encode(), dtype='uint8') - ord('0')).tobytes()
+
+def _unpack_bits(data):  # bytes -> b'0'/b'1' string
+    return (np.unpackbits(np.frombuffer(data, dtype='uint8')) + ord('0')).tobytes()
+
+
+def vbyte_encode(numbers):  # 7 bits per byte, most significant first, the last byte of a number is flagged
+    numbers = np.asarray(numbers, dtype='uint64')
+    if not len(numbers):
+        return b''
+    n_bytes = np.ones(len(numbers), dtype='int64')
+    for i in range(1, 10):
+        n_bytes += numbers >= (np.uint64(1) << np.uint64(7*i))
+    ends = np.cumsum(n_bytes) - 1
+    output = np.zeros(ends[-1] + 1, dtype='uint8')
+    for i in range(n_bytes.max()):
+        mask = n_bytes > i
+        output[ends[mask] - i] = (numbers[mask] >> np.uint64(7*i)) & np.uint64(0x7f)
+    output[ends] |= 0x80
+    return output.tobytes()
+
+def vbyte_decode(data, count=None):
+    array = np.frombuffer(data, dtype='uint8')
+    if not len(array):
+        return np.zeros(0, dtype='uint64')
+    ends = np.flatnonzero(array & 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = (np.repeat(ends, ends - starts + 1) - np.arange(len(array))) * 7
+    values = (array & 0x7f).astype('uint64') << shifts.astype('uint64')
+    return np.add.reduceat(values, starts)
+
+def iter_vbyte(data, count=None):
+    number = 0
+    for byte in data:
+        number = (number << 7) | (byte & 0x7f)
+        if byte & 0x80:
+            yield number
+            number = 0
+
+
+def gamma_encode(numbers):  # numbers must be positive
+    return _pack_bits(''.join(map(gamma, np.asarray(numbers, dtype='uint64').tolist())))
+
+def iter_gamma(data, count):
+    bits = _unpack_bits(data)
+    position = 0
+    for _ in range(count):
+        stop = bits.index(b'0', position)
+        length = stop - position
+        yield int(b'1' + bits[stop+1 : stop+1+length], 2)
+        position = stop + 1 + length
+
+def gamma_decode(data, count):
+    return np.fromiter(iter_gamma(data, count), dtype='uint64', count=count)
+
+
+def delta_encode(numbers):  # numbers must be positive
+    return _pack_bits(''.join(map(delta, np.asarray(numbers, dtype='uint64').tolist())))
+
+def iter_delta(data, count):
+    bits = _unpack_bits(data)
+    position = 0
+    for _ in range(count):
+        stop = bits.index(b'0', position)
+        length = int(b'1' + bits[stop+1 : 2*stop-position+1], 2) - 1
+        position = 2*stop - position + 1
+        yield int(b'1' + bits[position : position+length], 2)
+        position += length
+
+def delta_decode(data, count):
+    return np.fromiter(iter_delta(data, count), dtype='uint64', count=count)
+
+
+SIMPLE8B_SELECTORS = [  # (numbers per word, bits per number), the selector takes the top 4 bits of each word
+    (240, 0), (120, 0), (60, 1), (30, 2), (20, 3), (15, 4), (12, 5), (10, 6),
+    (8, 7), (7, 8), (6, 10), (5, 12), (4, 15), (3, 20), (2, 30), (1, 60)
+]
+
+def simple8b_encode(numbers):
+    numbers = np.asarray(numbers, dtype='uint64')
+    if len(numbers) and numbers.max() >= (np.uint64(1) << np.uint64(60)):
+        raise ValueError('Simple-8b can not encode numbers larger than 60 bits!')
+    bit_lengths = np.zeros(len(numbers), dtype='int64')
+    for i in range(60):
+        bit_lengths += numbers >= (np.uint64(1) << np.uint64(i))
+
+    words = []
+    i = 0
+    while i < len(numbers):
+        for selector, (n, bits) in enumerate(SIMPLE8B_SELECTORS):
+            if i + n <= len(numbers) and bit_lengths[i:i+n].max() <= bits:
+                break
+        word = np.uint64(selector) << np.uint64(60)
+        if bits:
+            shifts = (np.arange(n) * bits).astype('uint64')
+            word |= np.bitwise_or.reduce(numbers[i:i+n] << shifts)
+        words.append(word)
+        i += n
+    return np.asarray(words, dtype='<u8').tobytes()
+
+def simple8b_decode(data, count=None):
+    words = np.frombuffer(data, dtype='<u8')
+    selectors = (words >> np.uint64(60)).astype('int64')
+    sizes = np.asarray([n for n, _ in SIMPLE8B_SELECTORS])[selectors]
+    offsets = np.cumsum(sizes) - sizes
+    output = np.zeros(sizes.sum(), dtype='uint64')
+    for selector in np.unique(selectors):
+        n, bits = SIMPLE8B_SELECTORS[selector]
+        if not bits:
+            continue
+        mask = selectors == selector
+        shifts = (np.arange(n) * bits).astype('uint64')
+        values = (words[mask, None] >> shifts) & np.uint64((1 << bits) - 1)
+        output[offsets[mask, None] + np.arange(n)] = values
+    return output
+
+def iter_simple8b(data, count=None):
+    for word in np.frombuffer(data, dtype='<u8').tolist():
+        n, bits = SIMPLE8B_SELECTORS[word >> 60]
+        for i in range(n):
+            yield (word >> (i*bits)) & ((1 << bits) - 1)
+
+
+def _vbyte(number):  # the bytes of a single number, as vbyte_encode writes them
+    data = bytearray([number & 0x7f | 0x80])
+    number >>= 7
+    while number:
+        data.append(number & 0x7f)
+        number >>= 7
+    return bytes(reversed(data))
+
+
+CODECS = {  # name -> (encode, decode, the smallest number it can encode)
+    'vbyte': (vbyte_encode, vbyte_decode, 0),
+    'gamma': (gamma_encode, gamma_decode, 1),
+    'delta': (delta_encode, delta_decode, 1),
+    'simple8b': (simple8b_encode, simple8b_decode, 0),
+}
+
+
+class CompressedList:  # sorted numbers kept as gap-encoded blocks, decoded one block at a time while iterating
+    __slots__ = ('codec', 'blocks', 'tail')
+    block_size = 128
+
+    def __init__(self, numbers=(), codec='vbyte'):
+        if codec not in CODECS:
+            raise ValueError(f'Codec <{codec}> is not supported!')
+        self.codec = codec
+        self.blocks = []  # (last number, count, encoded gaps)
+        self.tail = []  # the latest numbers, waiting to fill a block
+        for number in numbers:
+            self.append(number)
+
+    @property
+    def last(self):
+        if self.tail:
+            return self.tail[-1]
+        if self.blocks:
+            return self.blocks[-1][0]
+
+    @property
+    def nbytes(self):
+        return sum(len(data) for _, _, data in self.blocks) + 8*len(self.tail)
+
+    def append(self, number):
+        if self.last is not None and number < self.last:  # out of order, so everything is re-encoded
+            numbers = sorted([*self, number])
+            self.blocks, self.tail = [], []
+            for number in numbers:
+                self.append(number)
+            return
+
+        self.tail.append(number)
+        if len(self.tail) == self.block_size:
+            self._flush()
+
+    def _flush(self):
+        encode, _, smallest = CODECS[self.codec]
+        base = self.blocks[-1][0] if self.blocks else 0
+        gaps = np.diff(np.asarray(self.tail, dtype='uint64'), prepend=np.uint64(base))
+        self.blocks.append((self.tail[-1], len(self.tail), encode(gaps + np.uint64(smallest))))
+        self.tail = []
+
+    def _decode(self, i):
+        _, decode, smallest = CODECS[self.codec]
+        _, count, data = self.blocks[i]
+        base = self.blocks[i-1][0] if i else 0
+        return from_gaps(decode(data, count) - np.uint64(smallest), base=base).tolist()
+
+    def __iter__(self):
+        for i in range(len(self.blocks)):
+            yield from self._decode(i)
+        yield from self.tail
+
+    def __len__(self):
+        return sum(count for _, count, _ in self.blocks) + len(self.tail)
+
+    def __contains__(self, number):
+        for i, (last, _, _) in enumerate(self.blocks):
+            if number <= last:  # only the block which may hold it is decoded
+                return number in self._decode(i)
+        return number in self.tail
+
+    def __eq__(self, other):
+        if isinstance(other, (CompressedList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def tolist(self):
+        return list(self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.tolist()}, codec={self.codec!r})'
+
+
+class PackedList(bytes):  # a short list of sorted numbers held in one bytes object, which costs less than the numbers
+    # vbyte numbers: the last one, then the gaps going down, so that appending reads a single number;
+    # vbyte whatever the codec, as a bit-level code would save less than a byte on a few numbers
+    __slots__ = ()
+
+    def __new__(cls, numbers=()):
+        numbers = sorted(numbers)
+        gaps = [b - a for a, b in zip(numbers, numbers[1:])]
+        return super().__new__(cls, b''.join(map(_vbyte, [numbers[-1], *reversed(gaps)])) if numbers else b'')
+
+    def _head(self):  # the last number and the count of its bytes
+        number = 0
+        for i, byte in enumerate(memoryview(self), start=1):
+            number = (number << 7) | (byte & 0x7f)
+            if byte & 0x80:
+                return number, i
+
+    @property
+    def last(self):
+        if self:
+            return self._head()[0]
+
+    @property
+    def nbytes(self):
+        return bytes.__len__(self)
+
+    def appended(self, number):  # a new list, this one can not change
+        last, size = self._head() if self else (None, 0)
+        if last is None or number < last:
+            return PackedList([*self, number])
+        return bytes.__new__(PackedList, _vbyte(number) + _vbyte(number - last) + self[size:])
+
+    def __iter__(self):
+        numbers = list(iter_vbyte(memoryview(self)))
+        for i in range(1, len(numbers)):
+            numbers[i] = numbers[i-1] - numbers[i]
+        return reversed(numbers)
+
+    def __len__(self):
+        return sum(byte >> 7 for byte in memoryview(self))  # the last byte of each number is flagged
+
+    def __bool__(self):
+        return bytes.__len__(self) > 0
+
+    def __contains__(self, number):
+        return number in list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (PackedList, CompressedList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return PackedList, (list(self),)
+
+    def tolist(self):
+        return list(self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.tolist()})'
+
+    __str__ = __repr__
 
 
 if __name__ == "__main__":
@@ -40,9 +344,20 @@ if __name__ == "__main__":
         'binary(5)',
         'unary(5)',
         'gamma(5)',
+        'delta(5)',
         'variable_byte(5)',
+        'variable_byte(130)',
         'get_size(5)'
     ]
     for case in test_cases:
         print(f"{case} = {eval(case)}")
     print()
+
+    doc_ids = np.cumsum(np.random.default_rng(0).geometric(0.05, size=1000))
+    print('Doc-IDs:', doc_ids[:10], '...')
+    print('Raw (uint32) size in bytes:', doc_ids.astype('uint32').nbytes)
+    for codec, (encode, decode, smallest) in CODECS.items():
+        encoded = encode(to_gaps(doc_ids) + np.uint64(smallest))
+        decoded = from_gaps(decode(encoded, len(doc_ids)) - np.uint64(smallest))
+        print(f'{codec} size in bytes:', len(encoded), '| round-trip:', bool(np.all(decoded == doc_ids)))
+    print('Packed size in bytes of the first 20:', PackedList(doc_ids[:20].tolist()).nbytes)
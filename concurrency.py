@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from itertools import repeat
+import threading
+import pickle
+import os
+
+import search
+
+
+class RWLock:  # many readers or a single writer, waiting writers go first so ingestion is never starved
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None  # id of the thread holding the write lock
+        self.writers_waiting = 0
+        self.local = threading.local()  # read depth of each thread, reads are reentrant
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self.local, 'depth', 0)
+        if depth or self.writer == threading.get_ident():  # this thread already reads (or writes)
+            self.local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.local.depth = depth
+            return
+
+        with self.condition:
+            while self.writer is not None or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        self.local.depth = 1
+        try:
+            yield
+        finally:
+            self.local.depth = 0
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self.writer == me:  # writes are reentrant too
+            yield
+            return
+        if getattr(self.local, 'depth', 0):
+            raise RuntimeError('A reader can not become a writer, it would wait for itself!')
+
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = me
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = None
+                self.condition.notify_all()
+
+    def __getstate__(self): return {}  # a copy of the index starts unlocked
+
+    def __setstate__(self, state): self.__init__()
+
+
+def reader(method):  # runs the method of an Index under its read lock
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def writer(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def split(items, n):  # n contiguous parts of (nearly) the same size
+    size, extra = divmod(len(items), n)
+    starts = [i*size + min(i, extra) for i in range(n + 1)]
+    return [items[start:stop] for start, stop in zip(starts[:-1], starts[1:]) if start < stop]
+
+
+_index = None  # the snapshot of the index in a worker process
+
+
+def _init_worker(snapshot):
+    global _index
+    _index = pickle.loads(snapshot)
+
+
+def _search_part(queries, k):
+    return search.search_many(_index, _index.documents, queries, k=k)
+
+
+def search_many(index, queries, k=None, workers=None, processes=False):
+    # the batch is split between the workers, the caller must hold the read lock until they are done
+    workers = workers or os.cpu_count()
+    parts = split(list(queries), workers)
+    if processes:  # each process gets a pickled snapshot of the index once, then only the queries are sent
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(pickle.dumps(index),)) as executor:
+            results = list(executor.map(_search_part, parts, repeat(k)))
+    else:  # threads overlap where numpy releases the GIL, without copying the index
+        with ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(lambda part: search.search_many(index, index.documents, part, k=k), parts))
+    return [result for part in results for result in part]
+
+
+if __name__ == "__main__":
+    import time
+
+    lock = RWLock()
+    log = []
+
+    def read(name):
+        with lock.read():
+            log.append(f'{name} reads')
+            time.sleep(0.05)
+            log.append(f'{name} is done')
+
+    def write():
+        with lock.write():
+            log.append('writer writes')
+
+    threads = [threading.Thread(target=read, args=(f'reader {i}',)) for i in range(2)]
+    threads.insert(1, threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    print('\n'.join(log))
+    print('Split:', split(list(range(10)), 3))
@@ -0,0 +1,175 @@
+import socketserver
+import argparse
+import signal
+import socket
+import json
+import time
+import sys
+import os
+
+
+# one json request per line, one json response per line:
+#   {"op": "search", "query": [...] or "text", "k": 10}  -> {"results": [[doc-id, score], ...]}
+#   {"op": "search_many", "queries": [...], "k": 10}      -> {"results": [[[doc-id, score], ...], ...]}
+#   {"op": "add", "document": [...], "doc_id": null}      -> {"doc_id": doc-id}
+#   {"op": "remove", "doc_id": doc-id, "lazy": false}     -> {}
+#   {"op": "info"}                                        -> {"class": ..., "documents": ..., ...}
+# a failed request gets {"error": message}, the connection stays open
+# the address is the path of a unix socket, or host:port for tcp where there are no unix sockets
+
+
+def _family(address):
+    if isinstance(address, str) and ':' in address and os.path.sep not in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def _ranking(results):  # a list keeps the rank order and the int doc-ids, which a json object would not
+    return [[doc_id, score] for doc_id, score in results.items()]
+
+
+def _query(query):
+    return query.split() if isinstance(query, str) else query
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.answer(json.loads(line))
+            except Exception as error:  # a bad request must not take the daemon down
+                response = {'error': f'{type(error).__name__}: {error}'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.TCPServer):  # keeps the index warm between queries
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, index, address):
+        self.index = index
+        self.started = time.time()
+        self.address_family, address = _family(address)
+        if self.address_family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)  # left behind by a daemon which did not shut down cleanly
+        super().__init__(address, Handler)
+
+    def answer(self, request):
+        op, index = request.get('op', 'search'), self.index
+        if op == 'search':
+            return {'results': _ranking(index.search(_query(request['query']), k=request.get('k')))}
+        if op == 'search_many':
+            results = index.search_many([_query(query) for query in request['queries']], k=request.get('k'))
+            return {'results': list(map(_ranking, results))}
+        if op == 'add':
+            return {'doc_id': index.add_document(request['document'], doc_id=request.get('doc_id'))}
+        if op == 'remove':
+            index.remove_document(request['doc_id'], lazy=request.get('lazy', False))
+            return {}
+        if op == 'info':
+            return {
+                'class': type(index).__name__, 'documents': len(index.documents) - len(index.tombstones),
+                'terms': len(index.terms), 'generation': index.generation, 'uptime': time.time() - self.started,
+                'cache': None if index.cache is None else index.cache.info()._asdict(),
+            }
+        raise ValueError(f'Unknown operation <{op}>!')
+
+    def server_close(self):
+        super().server_close()
+        if self.address_family == socket.AF_UNIX and os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(index, address, warm=True):  # blocks until interrupted
+    import preprocess
+
+    if warm:  # everything a first query would load, so that no query pays it
+        preprocess.warm_up()
+        index.matrix
+        index.kgrams
+    with Daemon(index, address) as daemon:
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+class Client:  # needs nothing but the standard library, so a script using it starts at once
+    def __init__(self, address, timeout=None):
+        family, address = _family(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self.reader = self.socket.makefile('rb')
+
+    def request(self, **request):
+        self.socket.sendall(json.dumps(request).encode() + b'\n')
+        response = json.loads(self.reader.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def search(self, query, k=None):  # {doc-id: score} in rank order, as Index.search
+        return dict(map(tuple, self.request(op='search', query=query, k=k)['results']))
+
+    def search_many(self, queries, k=None):
+        return [dict(map(tuple, results)) for results in self.request(op='search_many', queries=queries, k=k)['results']]
+
+    def add_document(self, document, doc_id=None):
+        return self.request(op='add', document=document, doc_id=doc_id)['doc_id']
+
+    def remove_document(self, doc_id, lazy=False):
+        self.request(op='remove', doc_id=doc_id, lazy=lazy)
+
+    def info(self):
+        return self.request(op='info')
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc_info): self.close()
+
+
+def _open(path, name, cache_size):
+    import index
+
+    cls = getattr(index, name)
+    if os.path.exists(os.path.join(path, 'meta.json')):  # a segment written by Index.save
+        opened = index.Index.load(path)
+    else:  # a directory with a write-ahead log, created if need be
+        opened = cls.open(path)
+    if cache_size:
+        opened.cache_results(maxsize=cache_size)
+    return opened
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serves an index from a long-lived process, or queries it.')
+    parser.add_argument('--address', default='index.sock', help='unix socket path, or host:port')
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help='loads the index and answers the queries')
+    server.add_argument('path', help='a saved segment, or the directory of a logged index (see Index.open)')
+    server.add_argument('--class', dest='name', default='PositionalPosting', help='index class of a new logged index')
+    server.add_argument('--cache', type=int, default=1024, help='size of the query cache, 0 disables it')
+    client = commands.add_parser('query', help='sends one query to a running daemon')
+    client.add_argument('terms', nargs='+')
+    client.add_argument('-k', type=int, default=10)
+    commands.add_parser('info', help='describes the served index')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        print('Serving on', args.address, file=sys.stderr)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit())  # a terminated daemon removes its socket too
+        serve(_open(args.path, args.name, args.cache), args.address)
+    else:
+        with Client(args.address) as connection:
+            if args.command == 'info':
+                print(json.dumps(connection.info(), indent=4))
+            else:
+                for doc_id, score in connection.search(args.terms, k=args.k).items():
+                    print(doc_id, f'{score:.6f}', sep='\t')
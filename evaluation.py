@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import time
+import numpy as np
+
+
+# qrels: qid -> {doc-id: relevance}, relevance > 0 means relevant
+# run:   qid -> {doc-id: score} in rank order, as returned by Index.search
+
+
+def read_qrels(path, doc_type=int):  # TREC qrels: <qid> <iteration> <doc-id> <relevance>
+    qrels = {}
+    with open(path) as handler:
+        for line in handler:
+            if line.strip():
+                qid, _, doc_id, relevance = line.split()
+                qrels.setdefault(qid, {})[doc_type(doc_id)] = int(relevance)
+    return qrels
+
+
+def read_run(path, doc_type=int):  # TREC run: <qid> Q0 <doc-id> <rank> <score> <tag>
+    rows = {}
+    with open(path) as handler:
+        for line in handler:
+            if line.strip():
+                qid, _, doc_id, rank, score, _ = line.split()
+                rows.setdefault(qid, []).append((int(rank), doc_type(doc_id), float(score)))
+    return {qid: {doc_id: score for _, doc_id, score in sorted(ranking)} for qid, ranking in rows.items()}
+
+
+def write_run(path, run, tag='index'):
+    with open(path, 'w') as handler:
+        for qid, ranking in run.items():
+            for rank, (doc_id, score) in enumerate(ranking.items(), start=1):
+                handler.write(f'{qid} Q0 {doc_id} {rank} {score:.6f} {tag}\n')
+
+
+def read_queries(path):  # one query per line: <qid> <tab> <text>
+    queries = {}
+    with open(path) as handler:
+        for line in handler:
+            if line.strip():
+                qid, text = line.rstrip('\n').split('\t', 1)
+                queries[qid] = text.split()
+    return queries
+
+
+_index = None  # the index of a worker process
+
+
+def _init_worker(index):
+    global _index
+    _index = index
+
+
+def _timed_search(query, k, index=None):
+    index = _index if index is None else index
+    start = time.perf_counter()
+    result = index.search(query, k=k)
+    return result, time.perf_counter() - start
+
+
+def run(index, queries, depth=1000, workers=None):  # (run, latencies in seconds), the queries are spread over processes
+    qids = list(queries)
+    if workers == 1:
+        answers = [_timed_search(queries[qid], depth, index=index) for qid in qids]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(index,)) as executor:  # the index is sent once per worker
+            answers = list(executor.map(partial(_timed_search, k=depth), [queries[qid] for qid in qids]))
+    return (
+        {qid: result for qid, (result, _) in zip(qids, answers)},
+        {qid: latency for qid, (_, latency) in zip(qids, answers)}
+    )
+
+
+def _gains(qrels, run, qids, depth):  # (n_queries, depth) relevance of each ranked doc, 0 past the end of a ranking
+    gains = np.zeros((len(qids), depth))
+    for i, qid in enumerate(qids):
+        judged = qrels.get(qid, {})
+        ranking = list(run.get(qid, {}))[:depth]
+        gains[i, :len(ranking)] = [judged.get(doc_id, 0) for doc_id in ranking]
+    return gains
+
+
+def evaluate(qrels, run, k=10):  # per-query AP, P@k, recall@k and nDCG@k over the queries of the qrels
+    import pandas as pd  # slow to import, and only the reports need it
+
+    qids = list(qrels)
+    depth = max([k, *(len(run.get(qid, {})) for qid in qids)])
+    gains = _gains(qrels, run, qids, depth)
+    relevant = gains > 0
+    n_relevant = np.array([sum(relevance > 0 for relevance in qrels[qid].values()) for qid in qids], dtype='float64')
+
+    hits = np.cumsum(relevant, axis=1)
+    precision = hits / np.arange(1, depth + 1)
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    ideal = np.zeros((len(qids), k))
+    for i, qid in enumerate(qids):
+        best = sorted(qrels[qid].values(), reverse=True)[:k]
+        ideal[i, :len(best)] = best
+    ideal = np.maximum(ideal, 0)
+
+    return pd.DataFrame({
+        'AP': _safe_divide(np.sum(precision * relevant, axis=1), n_relevant),
+        f'P@{k}': hits[:, k-1] / k,
+        f'recall@{k}': _safe_divide(hits[:, k-1], n_relevant),
+        f'nDCG@{k}': _safe_divide(np.sum(gains[:, :k] * discounts, axis=1), np.sum(ideal * discounts, axis=1)),
+    }, index=pd.Index(qids, name='qid'))
+
+
+def _safe_divide(a, b):
+    return np.divide(a, b, out=np.zeros_like(a, dtype='float64'), where=b != 0)
+
+
+def report(index, queries, qrels, k=10, depth=1000, workers=None):  # effectiveness and latency of every query, and their mean
+    results, latencies = run(index, {qid: queries[qid] for qid in qrels if qid in queries}, depth=depth, workers=workers)
+    table = evaluate(qrels, results, k=k)
+    table['latency (ms)'] = [1000 * latencies.get(qid, np.nan) for qid in table.index]
+    table.loc['mean'] = table.mean()
+    return table
+
+
+def tier_recall(index, queries, k=10):  # recall@k of the tiered ranking against the exhaustive one, and the latency of both
+    import pandas as pd
+
+    rows = {}
+    with index.lock.write():  # no search may run while the ranking is switched back and forth
+        tiers = index.tiers
+        try:
+            for qid, query in queries.items():
+                index.tiers = None
+                exact, exact_latency = _timed_search(query, k, index=index)
+                index.tiers = tiers
+                tiered, tiered_latency = _timed_search(query, k, index=index)
+                recall = len(exact.keys() & tiered.keys()) / len(exact) if exact else 1.0
+                rows[qid] = [recall, 1000 * exact_latency, 1000 * tiered_latency]
+        finally:
+            index.tiers = tiers
+    table = pd.DataFrame.from_dict(
+        rows, orient='index', columns=[f'recall@{k}', 'exact (ms)', 'tiered (ms)']
+    ).rename_axis('qid')
+    table.loc['mean'] = table.mean()
+    return table
+
+
+if __name__ == "__main__":
+    import index
+
+    documents = [
+        ['hello', 'world'],
+        ['hello', 'my', 'dear'],
+        ['what', 'on', 'world', 'is', 'going'],
+        ['how', 'the', 'world', 'seems', 'for', 'you']
+    ]
+    queries = {'q1': ['hello'], 'q2': ['world', 'going'], 'q3': ['"my', 'dear"']}
+    qrels = {'q1': {1: 1, 2: 2}, 'q2': {3: 2, 4: 1}, 'q3': {2: 1, 1: 1}}
+
+    positional = index.PositionalPosting()
+    positional.add_documents(documents)
+    print(report(positional, queries, qrels, k=2, workers=1))
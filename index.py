@@ -1,20 +1,64 @@
 from abc import ABC, abstractmethod
-from collections import UserDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from collections import UserDict, Counter
+from contextlib import contextmanager
+from functools import partial
+import bisect
 import json
+import threading
 import time
 import os
+import numpy as np
 
 import search
+import compress
+import matrix
+import kgram
 import score
+import stats
+import segment
+import compact
+import cache
+import evaluation
+import tracing
+import concurrency
+import trie
+import spimi
+import wal
 
 
 class Index(UserDict, ABC):
-    def __init__(self):
+    def __init__(self, codec=None):  # codec: keep the postings compressed with one of compress.CODECS
         super().__init__()
 
+        self.codec = codec
         self.terms = set()
+        self._kgrams = None
         self.documents = {}
+        self.tombstones = set()  # removed lazily: hidden from searches until 'compact' drops them
+        self.stats = stats.Statistics()
         self._doc_counter = 0
+        self._matrix = None
+        self._changed = set()  # docs added or removed since the matrix was last brought up to date
+        self.generation = 0  # bumped on every change, results cached on an older generation are dropped
+        self.cache = None
+        self.tiers = None  # see 'tiered'
+        self.tracer = tracing.NULL  # see 'trace'
+        self.lock = concurrency.RWLock()  # searches read, changes write
+        self._building = threading.Lock()  # readers share the lazily built kgrams and matrix
+        self.wal = None  # see 'open'
+        self._segment = None  # read lazily, see 'load'
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_building']
+        state['wal'] = None  # a copy of the index does not write to the log
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._building = threading.Lock()
 
     @property
     def docs(self): return list(self.documents.values())
@@ -23,21 +67,43 @@ class Index(UserDict, ABC):
     def doc_ids(self): return list(self.documents.keys())
 
     @property
-    @abstractmethod
-    def is_positional(self): return
+    def kgrams(self):  # built on the first wildcard, then kept up to date
+        if self._kgrams is None:
+            with self._building:
+                if self._kgrams is None:
+                    kgrams = kgram.KGramIndex()
+                    for term in self.terms:
+                        kgrams.add(term)
+                    self._kgrams = kgrams
+        return self._kgrams
 
+    @property
+    def matrix(self):  # built once, then the docs changed since the last search are patched in (idf moves with each one)
+        if self._matrix is None or self._changed:
+            with self._building:
+                if self._matrix is None:
+                    self._matrix = matrix.TermDocumentMatrix.from_statistics(self.stats)
+                elif self._changed:
+                    self._matrix = self._matrix.updated(self.stats.frequencies, self._changed)
+                self._changed = set()
+        return self._matrix
+
+    @property
     @abstractmethod
-    def count_term(self, term): return  # returns the frequency of the 'term'
+    def is_positional(self): return
 
     @abstractmethod
     def _add_document(self, terms, doc_id): pass  # add a doc considering the dictinoary structure
 
     @abstractmethod
-    def _remove_document(self, doc_id): pass
+    def _remove_document(self, terms, doc_id): pass  # only the postings of the doc's own terms are touched
 
     @abstractmethod
     def _get_term(self, term): return
 
+    @abstractmethod
+    def _postings(self, term): return  # sorted doc-ids of the 'term' without duplicates
+
     @classmethod
     def _dump(cls, filepath, dictionary, overwrite=True, backup=False, indent=4):
         if not overwrite and os.path.exists(filepath):
@@ -47,7 +113,7 @@ class Index(UserDict, ABC):
                 counter += 1
 
         with open(filepath, 'w') as handler:
-            json.dump(dictionary, handler, indent=indent)
+            json.dump(dictionary, handler, indent=indent, default=serialize)
 
         if backup:
             filedir, basename, ext = splitter(filepath)
@@ -62,19 +128,119 @@ class Index(UserDict, ABC):
                 indent=4
             )
 
+    @classmethod
+    def load(cls, path):  # opens a segment written by 'save', postings are read from it lazily
+        seg = segment.Segment(path)
+        index_class = globals()[seg.meta['class']]
+        if not issubclass(index_class, cls):
+            raise TypeError(f"Segment holds a <{index_class.__name__}>, not a <{cls.__name__}>!")
+
+        index = index_class(codec=seg.meta['codec'])
+        index._doc_counter = seg.meta['doc_counter']
+        index.tombstones = set(seg.meta.get('tombstones', ()))
+        index.terms = set(seg.terms)
+        index.documents = segment.LazyDict(seg.doc_rows, seg.document)
+        index.stats.df = Counter(dict(zip(seg.terms, seg.document_frequencies.tolist())))
+        index.stats.cf = Counter(dict(zip(seg.terms, seg.collection_frequencies.tolist())))
+        index.stats.lengths = dict(zip(seg.doc_ids.tolist(), seg.lengths.tolist()))
+        index.stats.frequencies = segment.LazyDict(seg.doc_rows, seg.frequencies)
+        index.data = index._load_data(seg)
+        index._matrix = seg.matrix()
+        index._segment = seg
+        return index
+
+    @concurrency.reader
+    def save(self, path):
+        segment.write(self, path)
+
+    @classmethod
+    def open(cls, directory, codec=None, fsync=True, checkpoint_every=10000):  # every change is logged, see wal.recover
+        return wal.recover(cls, directory, codec=codec, fsync=fsync, checkpoint_every=checkpoint_every)
+
+    @concurrency.reader  # only the writers log, so they wait while the readers go on
+    def checkpoint(self):  # a snapshot of the whole index, the log starts over
+        if self.wal is None:
+            raise ValueError('The index has no log, it must be opened with "open"!')
+        wal.checkpoint(self, self.wal.directory)
+
+    def close(self):
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
+
+    def _logged(self, op, **fields):  # called by the writers, under the write lock
+        if self.wal is not None:
+            self.wal.append(op, **fields)
+            if self.wal.due:
+                self.checkpoint()
+
+    @classmethod
+    def build(cls, documents, path, memory=spimi.MEMORY, codec=None, tmpdir=None):  # bulk indexing within a memory budget
+        spimi.build(documents, path, name=cls.__name__, codec=codec, memory=memory, tmpdir=tmpdir)
+        return cls.load(path)
+
+    @abstractmethod
+    def _load_data(self, seg): return
+
+    @abstractmethod
+    def _merge(self, other): pass  # appends the postings of 'other', whose doc-ids all come after ours
+
+    @classmethod
+    def build_parallel(cls, documents, workers=None, codec=None):  # each process indexes a doc-id range, then they are merged
+        documents = list(documents)
+        workers = workers or os.cpu_count()
+        size = max(1, -(-len(documents) // workers))
+        starts = range(0, len(documents), size)
+
+        index = cls(codec=codec)
+        with ProcessPoolExecutor(workers) as executor:
+            shards = executor.map(
+                _build_shard,
+                [cls] * len(starts),
+                [codec] * len(starts),
+                starts,
+                [documents[start:start+size] for start in starts]
+            )
+            for shard in shards:  # in doc-id order, so the postings are just concatenated
+                index.merge(shard)
+        return index
+
+    @concurrency.writer
+    def merge(self, other):
+        if type(other) is not type(self):
+            raise TypeError(f'Can not merge <{type(other).__name__}> into <{type(self).__name__}>!')
+        if self.documents and other.documents and min(other.documents) <= max(self.documents):
+            raise ValueError('Doc-IDs of the merged index must come after the existing ones!')
+
+        for term in other.terms:
+            if term not in self.terms:
+                self.terms.add(term)
+                if self._kgrams is not None:
+                    self._kgrams.add(term)
+        self.documents.update(other.documents)
+        self.tombstones.update(other.tombstones)
+        self.stats.merge(other.stats)
+        self._doc_counter = max(self._doc_counter, other._doc_counter)
+        self._matrix = None
+        self.generation += 1
+        self._merge(other)
+        if self.wal is not None:  # the merged docs are not logged one by one, a snapshot keeps them
+            self.checkpoint()
+        return self
+
     @classmethod
     def view_positional(cls, result, term=None):
         print(cls.__name__ + f" ({term})" if term else '')
         print("Doc-ID  | [Term-IDs]")
         for doc_id, term_ids in result.items():
-            if isinstance(term_ids, list):
-                print(format(doc_id, '<7'), term_ids, sep=' | ')
+            if isinstance(doc_id, int):
+                print(format(doc_id, '<7'), list(term_ids), sep=' | ')
         print()
 
     @classmethod
     def view_nonpositional(cls, result, term=None):
         print(cls.__name__ + f" ({term})" if term else '')
-        print('Doc-IDs:', result)
+        print('Doc-IDs:', list(result))
         print()
 
     def view_term(self, term):
@@ -83,48 +249,129 @@ class Index(UserDict, ABC):
         else:
             self.view_nonpositional(self.get_term(term), term=term)
 
+    def _new_list(self, numbers=()):  # with a codec, a short list is packed and a longer one is kept in blocks
+        if self.codec is None:
+            return list(numbers)
+        packed = compress.PackedList(numbers)
+        if packed.nbytes < compress.CompressedList.block_size:
+            return packed
+        return compress.CompressedList(packed, codec=self.codec)
+
+    def _load_positions(self, seg, term):  # the _load_term of the positional indexes keeping {doc-id: positions}
+        doc_ids, _ = seg.postings(term)
+        return {
+            doc_id: self._new_list(positions.tolist())
+            for doc_id, positions in zip(doc_ids.tolist(), seg.positions(term))
+        }
+
+    @concurrency.reader
     def get_term(self, term):
         if not self.validate_term(term):
             raise IndexError(f'Term <{term}> does not exists!')
         return self._get_term(term)
 
+    @concurrency.reader
+    def count_term(self, term):  # returns the frequency of the 'term'
+        if not self.validate_term(term):
+            raise IndexError(f'Term <{term}> does not exists!')
+        return self.stats.collection_frequency(term)
+
+    def postings(self, term):
+        if not self.validate_term(term):
+            return []
+        postings = self._postings(term)
+        self.tracer.count('postings', len(postings))
+        return postings
+
+    def positions(self, term, doc_id):  # sorted positions of the 'term' inside the doc
+        if not self.is_positional:
+            raise TypeError(f'{type(self).__name__} does not record the positions!')
+        if not self.validate_term(term):
+            return []
+        return self._positions(term, doc_id)
+
+    @concurrency.writer
     def add_document(self, document, doc_id=None):
         if doc_id is None:
             self._doc_counter += 1
             doc_id = self._doc_counter
         if self.validate_document(doc_id):
             raise IndexError(f'Doc-ID <{doc_id}> already exists!')
+        if doc_id in self.tombstones:
+            self._purge(doc_id)
 
         for term in document:
-            self.terms.add(term)
+            if term not in self.terms:
+                self.terms.add(term)
+                if self._kgrams is not None:
+                    self._kgrams.add(term)
         self.documents[doc_id] = document
+        self.stats.add(doc_id, document)
+        self._changed.add(doc_id)
+        self.generation += 1
         self._add_document(document, doc_id)
+        self._logged('add', doc_id=doc_id, counter=self._doc_counter, document=list(document))
         return doc_id
 
     def add_documents(self, docs):
         for doc in docs:
             self.add_document(doc)
 
-    def remove_document(self, doc_id):
+    @concurrency.writer
+    def remove_document(self, doc_id, lazy=False):  # lazy: just leave a tombstone, 'compact' removes it later
         if not self.validate_document(doc_id):
             raise ValueError(f'Doc-ID <{doc_id}> does not exists!')
 
-        for term in self.documents.pop(doc_id):
-            if self.count_term(term) == 0:
+        if lazy:
+            self.tombstones.add(doc_id)
+            self.generation += 1
+        else:
+            self._purge(doc_id)
+        self._logged('remove', doc_id=doc_id, lazy=lazy)
+
+    @concurrency.writer
+    def _purge(self, doc_id, tombstoned=False):  # tombstoned: only if it still is, another compaction may have been first
+        if tombstoned and doc_id not in self.tombstones:
+            return False
+        self.documents.pop(doc_id)
+        self._changed.add(doc_id)
+        self.generation += 1
+        terms = self.stats.remove(doc_id)  # the forward index tells which postings hold the doc
+        for term in terms:
+            if self.stats.document_frequency(term) == 0:
                 self.terms.remove(term)
-        self._remove_document(doc_id)
+                if self._kgrams is not None:
+                    self._kgrams.remove(term)
+        self._remove_document(terms, doc_id)
+        self.tombstones.discard(doc_id)
+        return True
 
-    def remove_documents(self, doc_ids):
+    def remove_documents(self, doc_ids, lazy=False):
         for doc_id in doc_ids:
-            self.remove_document(doc_id)
-
+            self.remove_document(doc_id, lazy=lazy)
+
+    def compact(self, background=False):  # drops the tombstoned docs for real
+        if background:
+            thread = threading.Thread(target=self.compact, daemon=True)
+            thread.start()
+            return thread
+
+        with self.lock.read():  # copied while no writer can change them
+            tombstones = list(self.tombstones)
+        # the tombstone stays until its doc is gone, so searches never see it
+        purged = [doc_id for doc_id in tombstones if self._purge(doc_id, tombstoned=True)]
+        if purged:
+            with self.lock.write():
+                self._logged('purge', doc_ids=purged)
+
+    @concurrency.reader
     def fetch_document(self, doc_id):
         if not self.validate_document(doc_id):
             raise IndexError(f'Doc-ID <{doc_id}> does not exists!')
         return self.documents[doc_id]
 
     def validate_document(self, doc_id):
-        return doc_id in self.documents
+        return doc_id in self.documents and doc_id not in self.tombstones
 
     def validate_term(self, term):
         return term in self.terms
@@ -136,31 +383,85 @@ class Index(UserDict, ABC):
             elif self.validate_term(term):
                 yield term
 
+    @concurrency.reader
     def dump(self, filepath=None, **kwargs):
         if filepath is None:
             filepath = type(self).__name__ + '.json'
         Index._dump(filepath, self.data, **kwargs)
 
-    def get_related_terms(self, term, itself=False):
-        return list(filter(lambda t: (term in t) and (True if itself else term != t), self.terms))
+    def get_related_terms(self, term, itself=False, where='infix'):  # where: 'prefix', 'suffix' or 'infix'
+        terms = getattr(self.kgrams, where)(term)
+        return terms if itself else list(filter(lambda t: t != term, terms))
 
     def format_query(self, query, wildcard=True, quote=True):
         return search.format_query(query, index=self, wildcard=wildcard, quote=quote)
 
-    def search(self, query):
-        return search.search(self, self.documents, query)
+    def cache_results(self, maxsize=1024, ttl=None):  # opt-in: repeated queries are answered from a cache
+        self.cache = cache.QueryCache(maxsize=maxsize, ttl=ttl)
+
+    def cache_info(self):
+        return None if self.cache is None else self.cache.info()
+
+    def tiered(self, champions=100, levels=3, growth=10):  # opt-in: top-k searches rank the champion lists first
+        # champions is the accuracy knob: more postings per term in the first tier, higher recall and latency
+        self.tiers = None if champions is None else matrix.tiers(champions, levels=levels, growth=growth)
+
+    def tier_recall(self, queries, k=10):  # see evaluation.tier_recall
+        if self.tiers is None:
+            raise ValueError('The index is not tiered, see "tiered"!')
+        return evaluation.tier_recall(self, queries, k=k)
+
+    @contextmanager
+    def trace(self, tracer=None, **kwargs):  # instruments the searches inside the block, kwargs go to tracing.Tracer
+        previous = self.tracer
+        self.tracer = tracing.Tracer(**kwargs) if tracer is None else tracer
+        try:
+            yield self.tracer
+        finally:
+            self.tracer = previous
+
+    @concurrency.reader
+    def search(self, query, k=None):
+        search.check_k(k)
+        return search.search(self, self.documents, query, k=k)
+
+    @concurrency.reader
+    def search_many(self, queries, k=None, workers=None, processes=False):  # workers: split the batch between threads (or processes)
+        search.check_k(k)
+        if workers is None:
+            return search.search_many(self, self.documents, queries, k=k)
+        return concurrency.search_many(self, queries, k=k, workers=workers, processes=processes)
 
     def score(self, document, query):
-        return score.score(self.docs, document, query)
+        return score.score(self.stats, document, query)
 
     def average_precision(self, documents, query, minimum=0, maximum=1):
-        return score.average_precision(self.docs, documents, query, minimum=minimum, maximum=maximum)
+        return score.average_precision(self.stats, documents, query, minimum=minimum, maximum=maximum)
 
     def mean_average_precision(self, documents, queries, minimum=0, maximum=1):
-        return score.mean_average_precision(self.docs, documents, queries, minimum=minimum, maximum=maximum)
+        return score.mean_average_precision(self.stats, documents, queries, minimum=minimum, maximum=maximum)
+
+    def evaluate(self, queries, qrels, k=10, depth=1000, workers=None):  # MAP, P@k, recall@k, nDCG@k and latency per query
+        return evaluation.report(self, queries, qrels, k=k, depth=depth, workers=workers)
 
     def steps_matrix(self, document, query):
-        return score.steps_matrix(self.docs, document, query)
+        return score.steps_matrix(self.stats, document, query)
+
+    @concurrency.reader
+    def explain(self, query, k=10):  # steps matrices of the top-k docs of the query, as one frame indexed by (doc-id, term)
+        results = self.search(query, k=k)
+        query = search.flatten(search.prepare_query(self, query))
+        return score.explain(self.stats, {doc_id: self.documents[doc_id] for doc_id in results}, query)
+
+    def memory_usage(self):  # deep size in bytes of each part of the index, shared objects are counted once
+        seen, usage = set(), {}
+        usage['postings'] = compact.sizeof(self.data, seen)
+        usage['documents'] = compact.sizeof(self.documents, seen)
+        usage['terms'] = compact.sizeof([self.terms, getattr(self, 'vocabulary', None), self._kgrams], seen)
+        usage['statistics'] = compact.sizeof(self.stats, seen)
+        usage['matrix'] = compact.sizeof(self._matrix, seen)
+        usage['total'] = sum(usage.values())
+        return usage
 
     def __setitem__(self, key, value):
         self.data[key] = value
@@ -171,30 +472,45 @@ class Posting(Index, ABC):
     def _get_term(self, term):
         return self[term]
 
+    def _load_data(self, seg):  # a bound method (not a closure) reads the terms, so the index can be pickled
+        return segment.LazyDict(seg.term_ids, partial(self._load_term, seg))
+
+    @abstractmethod
+    def _load_term(self, seg, term): return
+
+
+class Graph(Index, ABC):  # the terms are kept in a radix trie, each pointing to its postings
+    def __init__(self, codec=None):
+        super().__init__(codec=codec)
+        self.data = trie.RadixTrie()
 
-class Graph(Index, ABC):
     def _get_term(self, term):
-        node = self.data
-        for char in term:
-            if char not in node:
-                return
-            node = node[char]
-        return node
-
-    def remove_key(self, key, node=None):
-        if node is None:
-            node = self.data
-
-        if isinstance(node, dict):
-            for item in Graph._get_doc_ids(node):
-                if item == key:
-                    del node[key]
-            for value in node.values():
-                self.remove_key(key, node=value)
+        return self.data.get(term)
 
-    @classmethod
-    def _get_doc_ids(cls, dic):
-        return list(filter(lambda x: isinstance(x, int), dic.keys()))
+    def _load_data(self, seg):
+        return trie.RadixTrie.fromkeys(seg.terms, partial(self._load_term, seg))
+
+    @abstractmethod
+    def _load_term(self, seg, term): return
+
+    def _merge(self, other):
+        for term, postings in other.data.items():
+            if term in self.data:
+                self.data[term].update(postings)
+            else:
+                self.data[term] = postings
+
+    def _postings(self, term):
+        postings = self._get_term(term)
+        if postings is None:
+            return []
+        return sorted(postings)
+
+    def get_related_terms(self, term, itself=False, where='infix'):  # prefixes are read from the trie itself
+        if where != 'prefix':
+            return super().get_related_terms(term, itself=itself, where=where)
+        terms = self.data.prefix(term)
+        return terms if itself else list(filter(lambda t: t != term, terms))
 
 
 
@@ -203,16 +519,39 @@ class NonPositionalPosting(Posting):
 
     def _add_document(self, terms, doc_id):
         for term in terms:
-            self.setdefault(term, list())
-            self[term].append(doc_id)
+            self._insort(term, doc_id)
 
-    def _remove_document(self, doc_id):
-        for term, doc_ids in self.items():
-            if doc_id in doc_ids:
-                self[term].remove(doc_id)
+    def _insort(self, term, doc_id):  # keeps the doc-ids sorted even for custom ones
+        doc_ids = self[term] = insort(self[term] if term in self else self._new_list(), doc_id)
+        if isinstance(doc_ids, compress.PackedList) and doc_ids.nbytes >= compress.CompressedList.block_size:
+            self[term] = compress.CompressedList(doc_ids, codec=self.codec)  # grown too long to be packed
 
-    def count_term(self, term):
-        return len(self.get_term(term))
+    def _remove_document(self, terms, doc_id):
+        for term in terms:
+            doc_ids = self[term]
+            if isinstance(doc_ids, list):  # a doc-id repeats once per occurrence, all next to each other
+                del doc_ids[bisect.bisect_left(doc_ids, doc_id):bisect.bisect_right(doc_ids, doc_id)]
+            else:
+                doc_ids = self[term] = self._new_list(filter(lambda x: x != doc_id, doc_ids))
+            if not doc_ids:
+                del self[term]
+
+    def _postings(self, term):
+        return list(dict.fromkeys(self[term]))
+
+    def _merge(self, other):
+        for term, doc_ids in other.items():
+            if term not in self:
+                self[term] = doc_ids
+            elif isinstance(self[term], list):
+                self[term].extend(doc_ids)
+            else:
+                for doc_id in doc_ids:
+                    self._insort(term, doc_id)
+
+    def _load_term(self, seg, term):
+        doc_ids, tf = seg.postings(term)
+        return self._new_list(np.repeat(doc_ids, tf).tolist())
 
 
 class PositionalPosting(Posting):
@@ -221,19 +560,29 @@ class PositionalPosting(Posting):
     def _add_document(self, terms, doc_id):
         for term_id, term in enumerate(terms):
             self.setdefault(term, dict())
-            self[term].setdefault(doc_id, list())
+            self[term].setdefault(doc_id, [])
             self[term][doc_id].append(term_id)
+        if self.codec is not None:  # the positions of the doc are complete, they are packed once
+            for term in set(terms):
+                self[term][doc_id] = self._new_list(self[term][doc_id])
+
+    def _remove_document(self, terms, doc_id):
+        for term in terms:
+            self[term].pop(doc_id)
+            if not self[term]:
+                del self[term]
 
-    def _remove_document(self, doc_id):
-        for term, result in self.items():
-            if doc_id in result:
-                self[term].pop(doc_id)
+    def _postings(self, term):
+        return sorted(self[term])
 
-    def count_term(self, term):
-        count = 0
-        for term_ids in self.get_term(term).values():
-            count += len(term_ids)
-        return count
+    def _positions(self, term, doc_id):
+        return list(self[term].get(doc_id, []))
+
+    def _merge(self, other):
+        for term, result in other.items():
+            self.setdefault(term, dict()).update(result)
+
+    _load_term = Index._load_positions
 
 
 class PositionalGraph(Graph):
@@ -241,26 +590,112 @@ class PositionalGraph(Graph):
 
     def _add_document(self, document, doc_id):
         for term_id, term in enumerate(document):
-            node = self.data
-            for char in term:
-                node.setdefault(char, dict())
-                node = node[char]
-            node.setdefault(doc_id, list())
-            node[doc_id].append(term_id)
-
-    def _remove_document(self, doc_id):
-        self.remove_key(doc_id)
-
-    def count_term(self, term):
-        node = self.data
-        for char in term:
-            if char not in node:
-                break
-            node = node[char]
-        else:
-            return sum(map(len, map(lambda x: node[x], self._get_doc_ids(node))))
-        return -1
+            postings = self.data.get(term)
+            if postings is None:
+                postings = self.data[term] = dict()
+            postings.setdefault(doc_id, [])
+            postings[doc_id].append(term_id)
+        if self.codec is not None:  # the positions of the doc are complete, they are packed once
+            for term in set(document):
+                postings = self.data[term]
+                postings[doc_id] = self._new_list(postings[doc_id])
+
+    def _remove_document(self, terms, doc_id):
+        for term in terms:
+            postings = self.data[term]
+            del postings[doc_id]
+            if not postings:
+                del self.data[term]
+
+    def _positions(self, term, doc_id):
+        postings = self._get_term(term)
+        if postings is None:
+            return []
+        return list(postings.get(doc_id, []))
+
+    _load_term = Index._load_positions
+
+
+class CompactPosting(Posting, ABC):  # terms are interned once, docs are kept as term-id arrays and postings as flat arrays
+    def __init__(self, codec=None):
+        if codec is not None:
+            raise ValueError(f'{type(self).__name__} keeps its postings in arrays, codecs are not supported!')
+        super().__init__()
+        self.vocabulary = compact.Vocabulary()
+        self.documents = compact.Documents(self.vocabulary)
+        self.stats.frequencies = compact.Frequencies(self.vocabulary)
+
+    def _remove_document(self, terms, doc_id):
+        for term in terms:
+            self[term].remove(doc_id)
+            if not self[term]:
+                del self[term]
+
+    def _postings(self, term):
+        return self[term].doc_ids.tolist()
+
+    def _merge(self, other):
+        for term, postings in other.items():
+            if term in self:
+                self[term].extend(postings)
+            else:
+                self[term] = postings
+
+
+class CompactNonPositionalPosting(CompactPosting):
+    is_positional = False
+
+    def _add_document(self, terms, doc_id):
+        for term, count in Counter(terms).items():
+            self.setdefault(term, compact.Postings())
+            self[term].add(doc_id, count)
+
+    def _load_term(self, seg, term):
+        doc_ids, tf = seg.postings(term)
+        return compact.Postings(doc_ids.tolist(), tf.tolist())
+
+
+class CompactPositionalPosting(CompactPosting):
+    is_positional = True
+
+    def _add_document(self, terms, doc_id):
+        for term_id, term in enumerate(terms):
+            self.setdefault(term, compact.PositionalPostings())
+            self[term].add(doc_id, term_id)
+
+    def _positions(self, term, doc_id):
+        postings = self[term]
+        return postings[doc_id].tolist() if doc_id in postings else []
+
+    def _load_term(self, seg, term):
+        doc_ids, tf = seg.postings(term)
+        positions = seg.positions(term)
+        offsets = np.concatenate(([0], np.cumsum(tf, dtype='int64')))
+        return compact.PositionalPostings(doc_ids.tolist(), offsets.tolist(), np.concatenate(positions).tolist())
+
+
+
+def _build_shard(cls, codec, start, documents):
+    index = cls(codec=codec)
+    index._doc_counter = start
+    index.add_documents(documents)
+    return index
+
+
+def serialize(obj):  # json fallback for the lazy and compressed containers
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return list(obj)
+
 
+def insort(postings, doc_id):  # the postings with the doc-id, a packed list can not change so another one is returned
+    if isinstance(postings, list):
+        bisect.insort(postings, doc_id)
+    elif isinstance(postings, compress.PackedList):
+        return postings.appended(doc_id)
+    else:
+        postings.append(doc_id)  # compressed lists keep themselves sorted
+    return postings
 
 
 def splitter(path):
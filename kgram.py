@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+
+class KGramIndex:  # k-gram -> terms containing it, '$' marks the start and the end of each term
+    def __init__(self, k=3):
+        self.k = k
+        self.data = defaultdict(set)
+
+    def __len__(self): return len(self.data)
+
+    def grams(self, text):
+        return {text[i:i+self.k] for i in range(len(text) - self.k + 1)}
+
+    def add(self, term):
+        for gram in self.grams('$' + term + '$'):
+            self.data[gram].add(term)
+
+    def remove(self, term):
+        for gram in self.grams('$' + term + '$'):
+            self.data[gram].discard(term)
+            if not self.data[gram]:
+                del self.data[gram]
+
+    def _candidates(self, text):  # terms which may contain 'text', a superset of the answer
+        if len(text) < self.k:  # too short to have a k-gram, so every k-gram containing it is merged
+            return set().union(*(terms for gram, terms in self.data.items() if text in gram))
+        grams = sorted((self.data.get(gram, set()) for gram in self.grams(text)), key=len)
+        return grams[0].intersection(*grams[1:])
+
+    def prefix(self, prefix):
+        return sorted(filter(lambda t: t.startswith(prefix), self._candidates('$' + prefix)))
+
+    def suffix(self, suffix):
+        return sorted(filter(lambda t: t.endswith(suffix), self._candidates(suffix + '$')))
+
+    def infix(self, infix):
+        return sorted(filter(lambda t: infix in t, self._candidates(infix)))
+
+
+if __name__ == "__main__":
+    terms = ['hello', 'help', 'shell', 'world', 'word', 'sword', 'book', 'took', 'okay']
+
+    kgrams = KGramIndex()
+    for term in terms:
+        kgrams.add(term)
+
+    print('Terms:', terms)
+    print('Prefix (hel):', kgrams.prefix('hel'))
+    print('Suffix (ord):', kgrams.suffix('ord'))
+    print('Infix (ok):', kgrams.infix('ok'))
@@ -0,0 +1,331 @@
+from collections import Counter
+from functools import cached_property
+import bisect
+import heapq
+import math
+import numpy as np
+
+
+class TermDocumentMatrix:  # CSR matrix: a row per term holding its postings (columns are docs in doc-id order)
+    def __init__(self, terms, doc_ids, indptr, indices, counts, term_ids=None):
+        self.terms = list(terms)
+        self.term_ids = {term: row for row, term in enumerate(self.terms)} if term_ids is None else term_ids
+        self.doc_ids = np.asarray(doc_ids)
+        self.indptr = np.asarray(indptr)
+        self.indices = np.asarray(indices)
+        self.counts = np.asarray(counts)
+
+    # the weights are derived on first use, so a matrix over memory-mapped arrays is cheap to open
+
+    @cached_property
+    def idf(self):
+        return np.log10(len(self.doc_ids) / np.maximum(np.diff(self.indptr), 1))
+
+    @cached_property
+    def weights(self):
+        return (1 + np.log10(self.counts.astype('float64'))) * np.repeat(self.idf, np.diff(self.indptr))
+
+    @cached_property
+    def norms(self):
+        return np.sqrt(np.bincount(self.indices, weights=self.weights ** 2, minlength=len(self.doc_ids)))
+
+    @cached_property
+    def upper_bounds(self):  # the largest (doc-normalized) weight of each term bounds its contribution to any score
+        upper_bounds = np.zeros(len(self.terms), dtype='float64')
+        nonempty = np.diff(self.indptr) > 0
+        if len(self.indices):
+            normalized = _safe_divide(self.weights, self.norms[self.indices])
+            upper_bounds[nonempty] = np.maximum.reduceat(normalized, self.indptr[:-1][nonempty])
+        return upper_bounds
+
+    @cached_property
+    def impacts(self):  # postings of each row by decreasing normalized weight, the champion lists are their heads
+        rows = np.repeat(np.arange(len(self.terms)), np.diff(self.indptr))
+        return np.lexsort((self.indices, -_safe_divide(self.weights, self.norms[self.indices]), rows))
+
+    @property
+    def shape(self): return len(self.terms), len(self.doc_ids)
+
+    @classmethod
+    def from_statistics(cls, statistics):
+        terms = sorted(statistics.df)
+        term_ids = {term: row for row, term in enumerate(terms)}
+        doc_ids = sorted(statistics.frequencies)
+
+        rows, columns, counts = [], [], []
+        for column, doc_id in enumerate(doc_ids):
+            for term, tf in statistics.frequencies[doc_id].items():
+                rows.append(term_ids[term])
+                columns.append(column)
+                counts.append(tf)
+
+        rows = np.asarray(rows, dtype='int64')
+        order = np.argsort(rows, kind='stable')  # stable, so every row stays in doc-id order
+        indptr = np.zeros(len(terms) + 1, dtype='int64')
+        np.cumsum(np.bincount(rows, minlength=len(terms)), out=indptr[1:])
+        return cls(
+            terms,
+            np.asarray(doc_ids, dtype='int64'),
+            indptr,
+            np.asarray(columns, dtype='int64')[order],
+            np.asarray(counts, dtype='int64')[order],
+            term_ids=term_ids
+        )
+
+    def updated(self, frequencies, changed):  # a new matrix where the 'changed' docs take their frequencies, or are gone
+        # the kept postings stay in (term, doc) order, so only the postings of the changed docs are sorted and merged in;
+        # the weights, which move with every doc through idf, are derived again in a few vectorized passes
+        old_columns = self.columns(sorted(changed))
+        found = old_columns < len(self.doc_ids)
+        found[found] = self.doc_ids[old_columns[found]] == np.asarray(sorted(changed), dtype='int64')[found]
+        dropped = np.zeros(len(self.doc_ids), dtype='bool')
+        dropped[old_columns[found]] = True
+        indices = np.asarray(self.indices, dtype='int64')
+        keep = ~dropped[indices]
+        rows = np.repeat(np.arange(len(self.terms), dtype='int64'), np.diff(self.indptr))[keep]
+
+        added = sorted(doc_id for doc_id in changed if doc_id in frequencies)
+        new_terms, new_doc_ids, new_counts = [], [], []
+        for doc_id in added:
+            for term, tf in frequencies[doc_id].items():
+                new_terms.append(term)
+                new_doc_ids.append(doc_id)
+                new_counts.append(tf)
+
+        alive = np.bincount(rows, minlength=len(self.terms)) > 0
+        unseen = {term for term in new_terms if term not in self.term_ids}
+        if unseen or not alive.all():  # the vocabulary changed, the rows are numbered again
+            kept_rows = np.flatnonzero(alive)
+            # every new term counts, one whose postings were all removed may still be in term_ids
+            terms = sorted({*(self.terms[row] for row in kept_rows.tolist()), *new_terms})
+            term_ids = {term: row for row, term in enumerate(terms)}
+            renumbered = np.full(len(self.terms), -1, dtype='int64')
+            renumbered[kept_rows] = [term_ids[self.terms[row]] for row in kept_rows.tolist()]
+            rows = renumbered[rows]
+        else:
+            terms, term_ids = self.terms, self.term_ids
+
+        doc_ids = np.union1d(self.doc_ids[~dropped], np.asarray(added, dtype='int64'))
+        columns = np.searchsorted(doc_ids, self.doc_ids)[indices[keep]]
+        counts = np.asarray(self.counts, dtype='int64')[keep]
+
+        new_rows = np.fromiter(map(term_ids.__getitem__, new_terms), dtype='int64', count=len(new_terms))
+        new_columns = np.searchsorted(doc_ids, np.asarray(new_doc_ids, dtype='int64'))
+        new_keys = new_rows * len(doc_ids) + new_columns
+        order = np.argsort(new_keys, kind='stable')
+        at = np.searchsorted(rows * len(doc_ids) + columns, new_keys[order])
+        rows = np.insert(rows, at, new_rows[order])
+        columns = np.insert(columns, at, new_columns[order])
+        counts = np.insert(counts, at, np.asarray(new_counts, dtype='int64')[order])
+
+        indptr = np.zeros(len(terms) + 1, dtype='int64')
+        np.cumsum(np.bincount(rows, minlength=len(terms)), out=indptr[1:])
+        return type(self)(terms, doc_ids, indptr, columns, counts, term_ids=term_ids)
+
+    def _row(self, row):  # (columns, tf-idf weights) of a row, only its own postings are read
+        s = slice(self.indptr[row], self.indptr[row + 1])
+        return self.indices[s], (1 + np.log10(self.counts[s].astype('float64'))) * self.idf[row]
+
+    def row(self, term):  # (columns, weights) of the postings of 'term'
+        return self._row(self.term_ids[term])
+
+    def columns(self, doc_ids):
+        return np.searchsorted(self.doc_ids, np.asarray(doc_ids, dtype='int64'))
+
+    def query_vector(self, query):  # (rows, normalized tf-idf weights) of the query
+        counts = Counter(term for term in query if term in self.term_ids)
+        rows = np.fromiter(map(self.term_ids.get, counts), dtype='int64', count=len(counts))
+        weights = (1 + np.log10(np.fromiter(counts.values(), dtype='float64', count=len(counts)))) * self.idf[rows]
+        return rows, _safe_divide(weights, np.sqrt(np.sum(weights ** 2)))
+
+    def _gather(self, rows, weights):  # (columns, contributions) of all postings touched by a query vector
+        if not len(rows):
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float64')
+        postings = list(map(self._row, rows))
+        columns = np.concatenate([columns for columns, _ in postings])
+        contributions = np.concatenate([weight * row_weights for weight, (_, row_weights) in zip(weights, postings)])
+        return columns, contributions
+
+    def score(self, query, doc_ids, tracer=None):  # cosine similarity between the query and each of the (sorted) doc_ids
+        columns = self.columns(doc_ids)
+        touched, contributions = self._gather(*self.query_vector(query))
+        scores = _accumulate(columns, touched, contributions)
+        if tracer is not None:
+            tracer.count('matrix_postings', len(touched))
+            tracer.count('scored', len(columns))
+        return self.doc_ids[columns], _safe_divide(scores, self.norms[columns])
+
+    def score_many(self, queries, doc_ids, tracer=None):  # scores a batch of queries, each against its own (sorted) doc_ids
+        vectors = list(map(self.query_vector, queries))
+        columns = list(map(self.columns, doc_ids))
+        n_docs = len(self.doc_ids)
+        if not columns:
+            return []
+
+        # columns of the i-th query are shifted by i*n_docs, so the whole batch is accumulated at once
+        candidates = np.concatenate([i * n_docs + c for i, c in enumerate(columns)])
+        query_ids = np.concatenate([np.full(len(rows), i) for i, (rows, _) in enumerate(vectors)])
+        rows = np.concatenate([rows for rows, _ in vectors])
+        weights = np.concatenate([weights for _, weights in vectors])
+
+        touched, contributions = [np.zeros(0, dtype='int64')], [np.zeros(0, dtype='float64')]
+        for row in np.unique(rows):  # each row is read once, however many queries share it
+            row_columns, row_weights = self._row(row)
+            for query_id, weight in zip(query_ids[rows == row], weights[rows == row]):
+                touched.append(row_columns + query_id * n_docs)
+                contributions.append(weight * row_weights)
+
+        touched = np.concatenate(touched)
+        scores = _accumulate(candidates, touched, np.concatenate(contributions))
+        if tracer is not None:
+            tracer.count('matrix_postings', len(touched))
+            tracer.count('scored', len(candidates))
+        scores = _safe_divide(scores, np.concatenate([self.norms[c] for c in columns]))
+        sections = np.cumsum([len(c) for c in columns])[:-1]
+        return [(self.doc_ids[c], s) for c, s in zip(columns, np.split(scores, sections))]
+
+
+    def top_k(self, query, k, doc_ids=None, excluded=(), tracer=None):  # exact top-k by MaxScore, optionally within the (sorted) doc_ids
+        if k <= 0:  # nothing to rank, and the heap below needs room for one doc
+            return self.doc_ids[:0], np.zeros(0, dtype='float64')
+        rows, weights = self.query_vector(query)
+        bounds = weights * self.upper_bounds[rows]
+        order = np.argsort(bounds, kind='stable')
+        rows, weights, bounds = rows[order], weights[order], bounds[order]
+        prefix = np.cumsum(bounds).tolist()  # prefix[i]: the best score terms 0..i can reach together
+        allowed = None if doc_ids is None else set(self.columns(doc_ids).tolist())
+        excluded = set(self.columns(sorted(excluded)).tolist()) if excluded else set()
+
+        postings, contributions = [], []
+        for row, weight in zip(rows, weights):
+            row_columns, row_weights = self._row(row)
+            postings.append(row_columns.tolist())
+            contributions.append((weight * _safe_divide(row_weights, self.norms[row_columns])).tolist())
+        cursors = [0] * len(postings)
+        heap, threshold = [], 0.0  # heap of (score, -column), so the later of two equal docs is evicted
+        essential = 0  # terms before it can't reach the threshold on their own, so they never start a doc
+        scored = 0
+
+        while essential < len(postings):
+            column = min(
+                (postings[i][cursors[i]] for i in range(essential, len(postings)) if cursors[i] < len(postings[i])),
+                default=None
+            )
+            if column is None:
+                break
+
+            scored += 1
+            score, parts = 0.0, []
+            for i in range(essential, len(postings)):
+                if cursors[i] < len(postings[i]) and postings[i][cursors[i]] == column:
+                    score += contributions[i][cursors[i]]
+                    parts.append(contributions[i][cursors[i]])
+                    cursors[i] += 1
+            for i in reversed(range(essential)):
+                if score + prefix[i] <= threshold:
+                    break
+                cursors[i] = bisect.bisect_left(postings[i], column, cursors[i])
+                if cursors[i] < len(postings[i]) and postings[i][cursors[i]] == column:
+                    score += contributions[i][cursors[i]]
+                    parts.append(contributions[i][cursors[i]])
+            # the terms are read in the order of their upper bounds, which a shard knows only for its own docs:
+            # an exactly rounded sum does not depend on that order, so a shard scores a doc as the whole index does
+            score = math.fsum(parts)
+
+            if (allowed is not None and column not in allowed) or column in excluded:
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -column))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -column))
+            else:
+                continue
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while essential < len(postings) and prefix[essential] <= threshold:
+                    essential += 1
+
+        if tracer is not None:
+            tracer.count('matrix_postings', sum(map(len, postings)))
+            tracer.count('scored', scored)
+        heap.sort(key=lambda x: (-x[0], -x[1]))
+        columns = np.asarray([-column for _, column in heap], dtype='int64')
+        return self.doc_ids[columns], np.asarray([score for score, _ in heap], dtype='float64')
+
+
+    def champions(self, row, r=None):  # columns of the r best postings of a row, all of them for None
+        start, stop = self.indptr[row], self.indptr[row + 1]
+        return self.indices[self.impacts[start:stop if r is None else min(stop, start + r)]]
+
+    def top_k_tiered(self, query, k, tiers, excluded=(), tracer=None):  # approximate top-k, see 'tiers'
+        rows, weights = self.query_vector(query)
+        excluded = self.columns(sorted(excluded)) if excluded else np.zeros(0, dtype='int64')
+        read = 0
+        for level, r in enumerate(tiers, start=1):  # a lower tier is read only if the higher ones had too few docs
+            heads = [self.champions(row, r) for row in rows]
+            read = sum(map(len, heads))
+            candidates = np.setdiff1d(np.concatenate(heads) if heads else np.zeros(0, dtype='int64'), excluded)
+            if len(candidates) >= k:
+                break
+
+        scores = np.zeros(len(candidates), dtype='float64')
+        for row, weight in zip(rows, weights):  # the candidates get their exact score, found by binary search in each row
+            s = slice(self.indptr[row], self.indptr[row + 1])
+            row_columns = self.indices[s]
+            positions = np.searchsorted(row_columns, candidates)
+            found = positions < len(row_columns)
+            found[found] = row_columns[positions[found]] == candidates[found]
+            counts = self.counts[s][positions[found]].astype('float64')
+            scores[found] += weight * (1 + np.log10(counts)) * self.idf[row]
+        scores = _safe_divide(scores, self.norms[candidates])
+
+        if tracer is not None:
+            tracer.count('tiers', level if len(tiers) else 0)
+            tracer.count('matrix_postings', read)
+            tracer.count('scored', len(candidates))
+        order = np.lexsort((candidates, -scores))[:k]  # ties keep the doc-id order, as in top_k
+        return self.doc_ids[candidates[order]], scores[order]
+
+
+def tiers(champions, levels=3, growth=10):  # postings read per term by each tier, the last one reads them all
+    return tuple(champions * growth**level for level in range(levels - 1)) + (None,)
+
+
+def _accumulate(candidates, touched, contributions):  # sums the contributions landing on each (sorted) candidate
+    if not len(candidates):
+        return np.zeros(0, dtype='float64')
+    positions = np.searchsorted(candidates, touched)
+    valid = positions < len(candidates)
+    valid[valid] = candidates[positions[valid]] == touched[valid]
+    return np.bincount(positions[valid], weights=contributions[valid], minlength=len(candidates))
+
+
+def _safe_divide(a, b):
+    return np.divide(a, b, out=np.zeros_like(a, dtype='float64'), where=b != 0)
+
+
+def rank(doc_ids, scores):  # dict[doc-id, score] sorted by score, ties keep the doc-id order
+    order = np.argsort(-scores, kind='stable')
+    return dict(zip(np.asarray(doc_ids)[order].tolist(), np.asarray(scores)[order].tolist()))
+
+
+if __name__ == "__main__":
+    import stats
+
+    documents = [
+        ['hello', 'dear', 'how', 'are', 'you', 'today'],
+        ['hello', 'sir', 'here', 'is', 'the', 'plan'],
+        ['what', 'the', 'hell', 'are', 'you', 'pointing', 'to'],
+        ['i', 'am', 'interested', 'in', 'what', 'hell', 'and', 'heaven', 'are']
+    ]
+    statistics = stats.Statistics()
+    for doc_id, document in enumerate(documents, start=1):
+        statistics.add(doc_id, document)
+
+    matrix = TermDocumentMatrix.from_statistics(statistics)
+    query = ['today', 'is', 'what', 'you', 'interested']
+    print('Shape:', matrix.shape)
+    print('Query:', query)
+    print('Ranking:', rank(*matrix.score(query, [1, 2, 3, 4])))
+    print('Champions of <hello>:', matrix.doc_ids[matrix.champions(matrix.term_ids['hello'], 1)].tolist())
+    print('Tiered (r=1):', rank(*matrix.top_k_tiered(query, 2, tiers(1, levels=2))))
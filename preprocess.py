@@ -1,14 +1,15 @@
-from nltk.stem import PorterStemmer, WordNetLemmatizer
-from nltk.tokenize import TweetTokenizer
-from nltk.corpus import stopwords
-from nltk import pos_tag
-import pandas as pd
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial, cache
+from collections import deque
+import itertools
 import string
 import time
+import os
 
 
-STOPWORDS = stopwords.words('english')
+# nltk, its stopwords and models are loaded on first use (see __getattr__), so importing this module is cheap
+TRANSLATOR = str.maketrans(dict(zip(string.punctuation, ['']*len(string.punctuation))))
+CACHE_SIZE = 2**17  # tokens follow Zipf's law, so a bounded cache of the frequent ones catches most of them
 POS_TAGS = {
     'nn': 'n',
     'nns': 'n',
@@ -34,48 +35,121 @@ POS_TAGS = {
     'wrb': 'r',
 }
 
+@cache
+def get_stopwords():
+    from nltk.corpus import stopwords
+    return stopwords.words('english')
+
+@cache
+def get_stopwords_set():
+    return frozenset(get_stopwords())
+
+@cache
+def get_tokenizer():
+    from nltk.tokenize import TweetTokenizer
+    return TweetTokenizer(preserve_case=False, reduce_len=True, strip_handles=True)
+
+@cache
+def get_lemmatizer():
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+@cache
+def get_stemmer():
+    from nltk.stem import PorterStemmer
+    return PorterStemmer()
+
+LOADERS = {
+    'STOPWORDS': get_stopwords,
+    'STOPWORDS_SET': get_stopwords_set,
+    'tokenizer': get_tokenizer,
+    'lemmatizer': get_lemmatizer,
+    'stemmer': get_stemmer,
+}
+
+def __getattr__(name):  # the module attributes of the old eager loading, e.g. preprocess.stemmer
+    if name in LOADERS:
+        return LOADERS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():  # loads what the queries need up front, for long-lived processes which should not pay it on the first one
+    get_stopwords_set()
+    get_stemmer()
+    get_tokenizer()
+
 def tokenize(sentence):
-    return tokenizer.tokenize(sentence)
+    return get_tokenizer().tokenize(sentence)
 
 def is_stopword(token):
-    return (token in STOPWORDS) or (token in string.punctuation)
+    return (token in get_stopwords_set()) or (token in string.punctuation)
 
+@lru_cache(maxsize=CACHE_SIZE)
 def _stem(token):
-    return stemmer.stem(token)
+    return get_stemmer().stem(token)
 
 def stem(tokens):
     return list(map(_stem, tokens))
 
+@lru_cache(maxsize=CACHE_SIZE)
 def _lemmatize(token):
+    from nltk import pos_tag
     tag = pos_tag([token])[0][-1].lower()
     tag = POS_TAGS.get(tag, 'n')
-    return lemmatizer.lemmatize(token, tag)
+    return get_lemmatizer().lemmatize(token, tag)
 
 def lemmatize(tokens):
+    from nltk import pos_tag
+    lemmatizer = get_lemmatizer()
     tags = pos_tag(tokens)
     tags = list(map(lambda x: x[-1].lower(), tags))
     tags = list(map(lambda x: POS_TAGS.get(x, 'n'), tags))
     return list(map(lambda x: lemmatizer.lemmatize(*x), zip(tokens, tags)))
 
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(token, stemming=True, stopword=True, lower=True, strip=True, puncs=True):  # None for the stopwords
+    if stopword and is_stopword(token):
+        return None
+    if lower:
+        token = token.lower()
+    if puncs:
+        token = token.translate(TRANSLATOR)
+    if strip:
+        token = token.strip()
+    if stemming:
+        token = _stem(token)
+    return token
+
+def cache_info():
+    return {
+        'normalize': normalize.cache_info(),
+        'stem': _stem.cache_info(),
+        'lemmatize': _lemmatize.cache_info(),
+    }
+
+def cache_clear():
+    normalize.cache_clear()
+    _stem.cache_clear()
+    _lemmatize.cache_clear()
+
+def lemmatize_batch(documents):  # tags the whole batch at once instead of one call per document
+    from nltk import pos_tag_sents
+    lemmatizer = get_lemmatizer()
+    tagged = pos_tag_sents(documents)
+    return [
+        [lemmatizer.lemmatize(token, POS_TAGS.get(tag.lower(), 'n')) for token, tag in document]
+        for document in tagged
+    ]
+
 def preprocess(query, stemming=True, stopword=True, lower=True, strip=True, puncs=True):
-    translator = str.maketrans(dict(zip(string.punctuation, ['']*len(string.punctuation))))
     tokens = []
     for token in query:
         if isinstance(token, (list, tuple, set)):
             tokens.append(preprocess(token, stemming=stemming, stopword=stopword, lower=lower, strip=strip, puncs=puncs))
             continue
-        elif stopword and is_stopword(token):
-            continue
 
-        if lower:
-            token = token.lower()
-        if puncs:
-            token = token.translate(translator)
-        if strip:
-            token = token.strip()
-        if stemming:
-            token = _stem(token)
-        tokens.append(token)
+        token = normalize(token, stemming, stopword, lower, strip, puncs)
+        if token is not None:
+            tokens.append(token)
 
     return tokens
 
@@ -85,6 +159,35 @@ def preprocess_sentence(string, return_token=False, delimiter=' ', **kwargs):
         return tokens
     return delimiter.join(tokens)
 
+def _preprocess_chunk(texts, lemmatizing=False, **kwargs):
+    if lemmatizing:
+        kwargs['stemming'] = False
+        return lemmatize_batch([preprocess(tokenize(text), **kwargs) for text in texts])
+    return [preprocess(tokenize(text), **kwargs) for text in texts]
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def preprocess_corpus(iterable, workers=None, chunksize=256, lemmatizing=False, **kwargs):
+    # streams raw texts through a process pool, yielding token lists in the input order
+    function = partial(_preprocess_chunk, lemmatizing=lemmatizing, **kwargs)
+    if workers == 1:
+        for chunk in chunks(iterable, chunksize):
+            yield from function(chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks(iterable, chunksize):
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= 2 * workers:  # bounds how much of the corpus is read ahead
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 def unique_tokens(tokens):
     used_tokens = set()
     for token in tokens:
@@ -98,15 +201,15 @@ def unique_tokens(tokens):
             used_tokens.add(token)
 
 
-tokenizer = TweetTokenizer(preserve_case=False, reduce_len=True, strip_handles=True)
-lemmatizer = WordNetLemmatizer()
-stemmer = PorterStemmer()
-
-
 if __name__ == "__main__":
+    import pandas as pd
+    import numpy as np
+
+    tokenizer = get_tokenizer()
     doc = ['Hello', 'sir ', 'reading!']
     print('Document:', doc)
     print('Preprocessed:', preprocess(doc))
+    print('Cache:', cache_info()['normalize'])
     print()
 
     print('Benchmark stemming vs lemmatizing')
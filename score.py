@@ -1,8 +1,9 @@
 from functools import partial
-import pandas as pd
+from collections import Counter
 import numpy as np
 
 import preprocess
+import stats
 
 
 def term_frequency(document, term):
@@ -18,6 +19,8 @@ def _document_frequency(document, term):
     return int(term in document)
 
 def document_frequency(documents, term):
+    if isinstance(documents, stats.Statistics):
+        return documents.document_frequency(term)
     return sum(map(partial(_document_frequency, term=term), documents))
 
 def inverse_document_frequency(documents, term):
@@ -29,11 +32,6 @@ def weighting_term(docs, document, term):
 def document_length(docs, document, terms):
     return np.sqrt(np.sum(np.fromiter((weighting_term(docs, document, term) ** 2 for term in terms), 'float32')))
 
-def _normalized(docs, terms, document, term):
-    wt = weighting_term(docs, document, term)
-    length = document_length(docs, document, terms)
-    return wt / length
-
 def normalized(docs, terms, document):
     length = document_length(docs, document, terms)
     for term in terms:
@@ -55,26 +53,51 @@ def mean_average_precision(docs, documents: list[list[list[str]]], queries, mini
         score += average_precision(docs, _documents, query, minimum, maximum)
     return score / len(queries)
 
-def _steps_matrix(docs, total_terms, query):
-    matrix = pd.DataFrame()
-    matrix['terms'] = total_terms
-    matrix['tf'] = matrix['terms'].map(partial(term_frequency, query))
-    matrix['tf-wt'] = matrix['terms'].map(partial(term_frequency__weighting_term, query))
-    matrix['df'] = matrix['terms'].map(partial(document_frequency, docs))
-    matrix['idf'] = matrix['terms'].map(partial(inverse_document_frequency, docs))
-    matrix['wt'] = matrix['terms'].map(partial(weighting_term, docs, query))
-    matrix['nz'] = matrix['terms'].map(partial(_normalized, docs, total_terms, query))
-    return matrix
-
-def steps_matrix(docs, document, query):
-    total_terms = list(preprocess.unique_tokens([*document, *query]))
-    query_matrix = _steps_matrix(docs, total_terms, query)
-    doc_matrix = _steps_matrix(docs, total_terms, document)
-    matrix = query_matrix.set_index('terms').join(doc_matrix.set_index('terms'), lsuffix='_q', rsuffix='_d')
-    matrix.columns = pd.MultiIndex.from_product([['Query', 'Document'], ['tf', 'tf-wt', 'df', 'idf', 'wt', 'nz']])
+COLUMNS = ['tf', 'tf-wt', 'df', 'idf', 'wt', 'nz']
+
+
+def _weights(tf, idf, owners, n_owners):  # tf, tf-wt, wt and nz columns, each owner normalized by its own length
+    tf_wt = np.log10(tf, out=np.zeros(len(tf)), where=tf > 0)
+    tf_wt[tf > 0] += 1
+    wt = tf_wt * idf
+    length = np.sqrt(np.bincount(owners, weights=wt ** 2, minlength=n_owners))
+    return [tf, tf_wt, wt, np.divide(wt, length[owners], out=np.zeros(len(wt)), where=length[owners] != 0)]
+
+def explain(docs, documents: dict['doc-id', 'doc'], query):
+    # the steps matrix of every doc against the query, in one frame indexed by (doc-id, term)
+    if not isinstance(docs, stats.Statistics):
+        statistics = stats.Statistics()
+        for doc_id, document in enumerate(docs):
+            statistics.add(doc_id, document)
+        docs = statistics
+
+    query_counts = Counter(query)
+    doc_ids, terms, query_tf, doc_tf = [], [], [], []
+    for doc_id, document in documents.items():
+        doc_counts = Counter(document)
+        for term in preprocess.unique_tokens([*document, *query]):
+            doc_ids.append(doc_id)
+            terms.append(term)
+            query_tf.append(query_counts[term])
+            doc_tf.append(doc_counts[term])
+
+    import pandas as pd  # only the explanations need pandas, which is slow to import
+
+    owners, unique_doc_ids = pd.factorize(pd.Series(doc_ids, dtype='object'))
+    term_ids, unique_terms = pd.factorize(pd.Series(terms, dtype='object'))
+    df = np.fromiter(map(docs.document_frequency, unique_terms), dtype='int64', count=len(unique_terms))[term_ids]
+    idf = np.log10(np.divide(len(docs), df, out=np.ones(len(df)), where=df > 0))  # 0 for terms out of the collection
+
+    columns = {}
+    for side, tf in [('Query', query_tf), ('Document', doc_tf)]:
+        tf, tf_wt, wt, nz = _weights(np.asarray(tf, dtype='int64'), idf, owners, len(unique_doc_ids))
+        columns.update(zip([(side, column) for column in COLUMNS], [tf, tf_wt, df, idf, wt, nz]))
+    matrix = pd.DataFrame(columns, index=pd.MultiIndex.from_arrays([doc_ids, terms], names=['doc-id', 'terms']))
     matrix['prod'] = matrix['Query', 'nz'] * matrix['Document', 'nz']
     return matrix
 
+def steps_matrix(docs, document, query):
+    return explain(docs, {0: document}, query).droplevel('doc-id')
 
 if __name__ == "__main__":
     documents = [
@@ -1,8 +1,12 @@
 from functools import partial
 import operator
+import heapq
+import math
 
 import preprocess
+import matrix
 import score
+import cache
 
 
 def has_subset(array, subarray):
@@ -29,21 +33,106 @@ def is_doc_related(document, terms):
     return any(term in document for term in list(filter(lambda x: isinstance(x, str), terms)))
 
 
-def get_related_docs(documents, terms):
-    for doc_id, doc in documents.items():
-        if is_doc_related(doc, terms):
-            yield doc_id, doc
+def skip_length(postings):
+    return max(1, math.isqrt(len(postings)))
+
+
+def intersect(p1, p2):  # both postings must be sorted, skip pointers are placed every sqrt(len) items
+    answer = []
+    i, j = 0, 0
+    s1, s2 = skip_length(p1), skip_length(p2)
+    while i < len(p1) and j < len(p2):
+        if p1[i] == p2[j]:
+            answer.append(p1[i])
+            i += 1
+            j += 1
+        elif p1[i] < p2[j]:
+            if i % s1 == 0 and i+s1 < len(p1) and p1[i+s1] <= p2[j]:
+                while i+s1 < len(p1) and p1[i+s1] <= p2[j]:
+                    i += s1
+            else:
+                i += 1
+        else:
+            if j % s2 == 0 and j+s2 < len(p2) and p2[j+s2] <= p1[i]:
+                while j+s2 < len(p2) and p2[j+s2] <= p1[i]:
+                    j += s2
+            else:
+                j += 1
+    return answer
+
+
+def intersect_many(postings):
+    postings = sorted(postings, key=len)  # start from the rarest term to keep the answer small
+    if not postings:
+        return []
+    answer = postings[0]
+    for p in postings[1:]:
+        if not answer:
+            break
+        answer = intersect(answer, p)
+    return answer
+
+
+def union(*postings):
+    answer = []
+    for doc_id in heapq.merge(*postings):
+        if not answer or answer[-1] != doc_id:
+            answer.append(doc_id)
+    return answer
+
+
+def get_related_doc_ids(index, terms):
+    quotes = list(filter(lambda x: isinstance(x, list), terms))
+    if quotes:
+        quote_terms = list(dict.fromkeys(flatten(quotes)))
+        if not quote_terms:
+            doc_ids = sorted(index.documents)
+        else:
+            doc_ids = intersect_many(list(map(index.postings, quote_terms)))
+    else:
+        doc_ids = union(*map(index.postings, filter(lambda x: isinstance(x, str), terms)))
+
+    if index.tombstones:
+        return list(filter(lambda doc_id: doc_id not in index.tombstones, doc_ids))
+    return doc_ids
+
+
+def has_phrase(index, phrase, doc_id):  # positional intersection: each term must follow the previous one
+    if not phrase:
+        return True
+    starts = index.positions(phrase[0], doc_id)
+    for offset, term in enumerate(phrase[1:], start=1):
+        if not starts:
+            break
+        starts = intersect(starts, [position - offset for position in index.positions(term, doc_id)])
+    return bool(starts)
+
+
+def get_related_docs(documents, terms, index=None):
+    if index is None:  # without an index, every document has to be checked
+        for doc_id, doc in documents.items():
+            if is_doc_related(doc, terms):
+                yield doc_id, doc
+        return
+
+    quotes = list(filter(lambda x: isinstance(x, list), terms))
+    for doc_id in get_related_doc_ids(index, terms):
+        if index.is_positional:
+            if all(has_phrase(index, quote, doc_id) for quote in quotes):
+                yield doc_id, documents[doc_id]
+        elif all(has_subset(documents[doc_id], quote) for quote in quotes):
+            yield doc_id, documents[doc_id]
 
 
 def get_position_of_quotes(query):
     start_idx, stop_idx = None, None
     for idx, term in enumerate(query):
-        if not start_idx and term.startswith('"'):
+        if start_idx is None and term.startswith('"'):  # 0 is a position too, a quote may open the query
             start_idx = idx
-        if start_idx and term.endswith('"'):
+        if start_idx is not None and term.endswith('"'):
             stop_idx = idx
 
-        if start_idx and stop_idx:
+        if start_idx is not None and stop_idx is not None:
             yield start_idx, stop_idx
             start_idx, stop_idx = None, None
 
@@ -51,11 +140,18 @@ def get_position_of_quotes(query):
 def handle_wildcard(query, index=None, replace=True):
     terms = query.copy()
     for idx, term in enumerate(query):
-        if term.startswith('*'):
-            term = term.removeprefix('*')
+        if term.startswith('*'):  # *term (or *term*) matches every term containing it
+            term = term.removeprefix('*').removesuffix('*')
             terms[idx] = term
             if replace and index is not None:
                 terms.extend(index.get_related_terms(term))
+        elif term.endswith('*'):  # term* matches every term starting with it
+            term = term.removesuffix('*')
+            terms[idx] = term
+            if replace and index is not None:
+                terms.extend(index.get_related_terms(term, where='prefix'))
+    if index is not None:
+        index.tracer.count('expanded_terms', len(terms) - len(query))
     return terms
 
 
@@ -96,27 +192,114 @@ def format_query(query, index=None, wildcard=True, quote=True):
     return terms
 
 
-def _search(documents: dict['doc-id', 'doc'], query) -> dict['doc_id', 'doc_score']:
+def _candidates(documents, query, index):
+    with index.tracer.stage('candidates'):
+        doc_ids = [doc_id for doc_id, _ in get_related_docs(documents, query, index=index)]
+    index.tracer.count('candidates', len(doc_ids))
+    return doc_ids
+
+
+def _top_k(documents, query, index, k):
+    tracer = index.tracer
+    if any(isinstance(term, list) for term in query):  # only the docs holding every phrase may be ranked
+        doc_ids = _candidates(documents, query, index)
+        with tracer.stage('scoring'):
+            return index.matrix.top_k(flatten(query), k, doc_ids=doc_ids, tracer=tracer)
+    with tracer.stage('scoring'):
+        if index.tiers is not None:
+            return index.matrix.top_k_tiered(flatten(query), k, index.tiers, excluded=index.tombstones, tracer=tracer)
+        return index.matrix.top_k(flatten(query), k, excluded=index.tombstones, tracer=tracer)
+
+
+def check_k(k):  # None ranks every doc, 0 none of them
+    if k is not None and k < 0:
+        raise ValueError(f'k <{k}> must not be negative!')
+
+
+def _rank(index, doc_ids, scores):
+    with index.tracer.stage('ranking'):
+        return matrix.rank(doc_ids, scores)
+
+
+def _search(documents: dict['doc-id', 'doc'], query, index=None, k=None) -> dict['doc_id', 'doc_score']:
+    if index is not None:
+        if k is not None:
+            return _rank(index, *_top_k(documents, query, index, k))
+        doc_ids = _candidates(documents, query, index)
+        with index.tracer.stage('scoring'):
+            doc_ids, scores = index.matrix.score(flatten(query), doc_ids, tracer=index.tracer)
+        return _rank(index, doc_ids, scores)
+
     score_function = partial(score.score, list(documents.values()), query=flatten(query))
     return dict(
         sorted(
             list(
                 map(
                     lambda x: (x[0], score_function(x[1])),
-                    list(get_related_docs(documents, query))  # (doc-id, doc)
+                    list(get_related_docs(documents, query, index=index))  # (doc-id, doc)
                 )
             ),
             key=operator.itemgetter(-1),
             reverse=True
-        )
+        )[:k]
     )
 
 
-def search(index, documents, query):
-    query = format_query(query, index=index)
-    query = preprocess.preprocess(query)
-    query = list(index.validate_terms(query))
-    return _search(documents, query)
+def prepare_query(index, query):
+    tracer = index.tracer
+    with tracer.stage('format_query'):
+        query = format_query(query, index=index)
+    with tracer.stage('preprocess'):
+        query = preprocess.preprocess(query)
+    with tracer.stage('validate_terms'):
+        return list(index.validate_terms(query))
+
+
+def search(index, documents, query, k=None):
+    with index.tracer.query(query):
+        query = prepare_query(index, query)
+        if index.cache is None:
+            return _search(documents, query, index=index, k=k)
+
+        key = (cache.freeze(query), k, index.tiers)
+        result = index.cache.get(key, index.generation)
+        index.tracer.count('cache_misses' if result is None else 'cache_hits')
+        if result is None:
+            result = index.cache.put(key, index.generation, _search(documents, query, index=index, k=k))
+        return dict(result)  # a copy, so the cached one can't be changed by the caller
+
+
+def search_many(index, documents, queries, k=None) -> list[dict['doc_id', 'doc_score']]:
+    with index.tracer.query(queries):  # the batch is traced as one query
+        return _search_many(index, documents, queries, k=k)
+
+
+def _search_many(index, documents, queries, k=None):
+    queries = [prepare_query(index, query) for query in queries]
+    results = [None] * len(queries)
+    if index.cache is not None:
+        keys = [(cache.freeze(query), k, index.tiers) for query in queries]
+        results = [index.cache.get(key, index.generation) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if index.cache is not None:
+        index.tracer.count('cache_hits', len(queries) - len(missing))
+        index.tracer.count('cache_misses', len(missing))
+
+    if k is not None:
+        for i in missing:
+            results[i] = _rank(index, *_top_k(documents, queries[i], index, k))
+    elif missing:
+        doc_ids = [_candidates(documents, queries[i], index) for i in missing]
+        with index.tracer.stage('scoring'):
+            scores = index.matrix.score_many([flatten(queries[i]) for i in missing], doc_ids, tracer=index.tracer)
+        for i, result in zip(missing, scores):
+            results[i] = _rank(index, *result)
+
+    if index.cache is None:
+        return results
+    for i in missing:
+        index.cache.put(keys[i], index.generation, results[i])
+    return list(map(dict, results))
 
 
 
@@ -0,0 +1,246 @@
+from collections.abc import MutableMapping
+from collections import Counter
+import shutil
+import json
+import mmap
+import os
+import numpy as np
+
+import matrix
+
+
+VERSION = 1
+FILES = ['terms', 'dictionary', 'postings', 'positions', 'documents', 'scores']
+
+# terms.bin       utf-8 terms, sorted and concatenated
+# dictionary.bin  int64 (n_terms+1, 3): offsets of each term into terms.bin, postings.bin and positions.bin
+# postings.bin    uint32 doc columns (doc-id order), then uint32 term frequencies, one per posting
+# positions.bin   uint32 positions, one per token, grouped by term then doc
+# documents.bin   int64 doc-ids (sorted), int64 offsets into the tokens, then uint32 term-ids of every doc
+# scores.bin      float64 norm of every doc, then float64 score upper bound of every term
+
+
+def write(index, path):  # written aside then swapped in, the index may be reading the very segment it replaces
+    path = os.path.normpath(path)
+    shutil.rmtree(path + '.tmp', ignore_errors=True)
+    _write(index, path + '.tmp')
+    replace(path + '.tmp', path)
+
+
+def replace(source, path):  # a directory can not be renamed over another one, so the old segment is moved away first
+    shutil.rmtree(path + '.old', ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, path + '.old')
+    os.rename(source, path)
+    shutil.rmtree(path + '.old', ignore_errors=True)  # posix keeps the mapped files alive for whoever still reads them
+
+
+def _write(index, path):
+    terms = sorted(index.stats.df)
+    term_ids = {term: i for i, term in enumerate(terms)}
+    doc_ids = sorted(index.documents)
+    documents = [index.documents[doc_id] for doc_id in doc_ids]
+
+    lengths = np.fromiter(map(len, documents), dtype='int64', count=len(documents))
+    doc_offsets = np.zeros(len(documents) + 1, dtype='int64')
+    np.cumsum(lengths, out=doc_offsets[1:])
+    tokens = np.fromiter((term_ids[term] for document in documents for term in document), dtype='uint32', count=doc_offsets[-1])
+    columns = np.repeat(np.arange(len(documents), dtype='int64'), lengths)
+    positions = np.arange(len(tokens), dtype='int64') - np.repeat(doc_offsets[:-1], lengths)
+
+    order = np.lexsort((positions, columns, tokens))  # by term, then doc, then position
+    tokens_, columns_ = tokens[order], columns[order]
+    starts = np.flatnonzero(np.concatenate((
+        [True], (tokens_[1:] != tokens_[:-1]) | (columns_[1:] != columns_[:-1])
+    ))) if len(order) else np.zeros(0, dtype='int64')
+    tf = np.diff(np.append(starts, len(order)))
+
+    encoded = [term.encode() for term in terms]
+    dictionary = np.zeros((len(terms) + 1, 3), dtype='<i8')
+    np.cumsum(list(map(len, encoded)), out=dictionary[1:, 0])
+    np.cumsum(np.bincount(tokens_[starts], minlength=len(terms)), out=dictionary[1:, 1])
+    np.cumsum(np.bincount(tokens_, minlength=len(terms)), out=dictionary[1:, 2])
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'terms.bin'), 'wb') as handler:
+        handler.write(b''.join(encoded))
+    with open(os.path.join(path, 'dictionary.bin'), 'wb') as handler:
+        handler.write(dictionary.tobytes())
+    with open(os.path.join(path, 'postings.bin'), 'wb') as handler:
+        handler.write(columns_[starts].astype('<u4').tobytes())
+        handler.write(tf.astype('<u4').tobytes())
+    with open(os.path.join(path, 'positions.bin'), 'wb') as handler:
+        handler.write(positions[order].astype('<u4').tobytes())
+    with open(os.path.join(path, 'documents.bin'), 'wb') as handler:
+        handler.write(np.asarray(doc_ids, dtype='<i8').tobytes())
+        handler.write(doc_offsets.astype('<i8').tobytes())
+        handler.write(tokens.astype('<u4').tobytes())
+    with open(os.path.join(path, 'scores.bin'), 'wb') as handler:
+        handler.write(index.matrix.norms.astype('<f8').tobytes())
+        handler.write(index.matrix.upper_bounds.astype('<f8').tobytes())
+    write_meta(
+        path, type(index).__name__, index.codec, index._doc_counter,
+        n_terms=len(terms), n_postings=len(starts), n_tokens=len(tokens), n_docs=len(doc_ids),
+        tombstones=sorted(index.tombstones)
+    )
+
+
+def write_meta(path, name, codec, doc_counter, n_terms, n_postings, n_tokens, n_docs, tombstones=()):
+    with open(os.path.join(path, 'meta.json'), 'w') as handler:  # written last, it marks the segment as complete
+        json.dump({
+            'version': VERSION,
+            'class': name,
+            'codec': codec,
+            'doc_counter': doc_counter,
+            'n_terms': n_terms,
+            'n_postings': n_postings,
+            'n_tokens': n_tokens,
+            'n_docs': n_docs,
+            'tombstones': list(tombstones),  # lazily removed docs, still in the files until a compaction
+        }, handler, indent=4)
+
+
+def _map(filepath):
+    if not os.path.getsize(filepath):
+        return b''  # empty files can't be mapped
+    with open(filepath, 'rb') as handler:
+        return mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _identity(path):  # tells a segment from another one written later at the same path, None if there is none
+    try:
+        stat = os.stat(os.path.join(path, 'meta.json'))
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+
+class Segment:  # read-only view over a written segment, the arrays are memory-mapped and paged in on demand
+    def __init__(self, path):
+        identity = _identity(path)
+        with open(os.path.join(path, 'meta.json')) as handler:
+            meta = json.load(handler)
+        if meta['version'] != VERSION:
+            raise ValueError(f"Segment version <{meta['version']}> is not supported!")
+        self._open(path, meta, {name: _map(os.path.join(path, name + '.bin')) for name in FILES})
+        self.identity = identity
+
+    def _open(self, path, meta, buffers):
+        self.path, self.meta, self.buffers = path, meta, buffers
+        self.identity = None
+
+        n_terms, n_postings = self.meta['n_terms'], self.meta['n_postings']
+        n_tokens, n_docs = self.meta['n_tokens'], self.meta['n_docs']
+        self.dictionary = np.frombuffer(self.buffers['dictionary'], dtype='<i8').reshape(n_terms + 1, 3)
+        self.columns = np.frombuffer(self.buffers['postings'], dtype='<u4', count=n_postings)
+        self.tf = np.frombuffer(self.buffers['postings'], dtype='<u4', count=n_postings, offset=4*n_postings)
+        self.positions_ = np.frombuffer(self.buffers['positions'], dtype='<u4', count=n_tokens)
+        self.doc_ids = np.frombuffer(self.buffers['documents'], dtype='<i8', count=n_docs)
+        self.doc_offsets = np.frombuffer(self.buffers['documents'], dtype='<i8', count=n_docs + 1, offset=8*n_docs)
+        self.tokens = np.frombuffer(self.buffers['documents'], dtype='<u4', count=n_tokens, offset=8*(2*n_docs + 1))
+        self.norms = np.frombuffer(self.buffers['scores'], dtype='<f8', count=n_docs)
+        self.upper_bounds = np.frombuffer(self.buffers['scores'], dtype='<f8', count=n_terms, offset=8*n_docs)
+
+        blob, offsets = bytes(self.buffers['terms']), self.dictionary[:, 0].tolist()
+        self.terms = [blob[start:stop].decode() for start, stop in zip(offsets[:-1], offsets[1:])]
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.doc_rows = dict(zip(self.doc_ids.tolist(), range(n_docs)))
+
+    @property
+    def document_frequencies(self): return np.diff(self.dictionary[:, 1])
+
+    @property
+    def collection_frequencies(self): return np.diff(self.dictionary[:, 2])
+
+    @property
+    def lengths(self): return np.diff(self.doc_offsets)
+
+    def postings(self, term):  # (doc-ids, term frequencies)
+        i = self.term_ids[term]
+        start, stop = self.dictionary[i, 1], self.dictionary[i+1, 1]
+        return self.doc_ids[self.columns[start:stop]], self.tf[start:stop]
+
+    def positions(self, term):  # positions of the term inside each doc of its postings
+        i = self.term_ids[term]
+        start, stop = self.dictionary[i, 1], self.dictionary[i+1, 1]
+        tf = self.tf[start:stop].astype('int64')
+        positions = self.positions_[self.dictionary[i, 2]:self.dictionary[i+1, 2]]
+        return np.split(positions, np.cumsum(tf)[:-1])
+
+    def document(self, doc_id):
+        row = self.doc_rows[doc_id]
+        return [self.terms[i] for i in self.tokens[self.doc_offsets[row]:self.doc_offsets[row+1]].tolist()]
+
+    def frequencies(self, doc_id):
+        return Counter(self.document(doc_id))
+
+    def matrix(self):
+        term_document = matrix.TermDocumentMatrix(
+            self.terms, self.doc_ids, self.dictionary[:, 1], self.columns, self.tf, term_ids=self.term_ids
+        )
+        term_document.norms, term_document.upper_bounds = self.norms, self.upper_bounds  # saves a pass over all postings
+        return term_document
+
+    def __getstate__(self):  # a copy maps the files again, or gets their bytes once another segment took their path
+        if self.identity is not None and _identity(self.path) == self.identity:
+            return {'path': self.path}
+        return {'path': self.path, 'meta': self.meta, 'buffers': {name: bytes(buffer) for name, buffer in self.buffers.items()}}
+
+    def __setstate__(self, state):
+        if 'buffers' in state:
+            self._open(state['path'], state['meta'], state['buffers'])
+        else:
+            self.__init__(state['path'])
+
+    def close(self):  # arrays taken from the segment must be released before
+        for name in ['dictionary', 'columns', 'tf', 'positions_', 'doc_ids', 'doc_offsets', 'tokens', 'norms', 'upper_bounds']:
+            setattr(self, name, None)
+        for buffer in self.buffers.values():
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+
+class LazyDict(MutableMapping):  # values are read from the segment on first access, then kept (and changed) in memory
+    def __init__(self, keys, loader):
+        self.source = keys  # keys stored in the segment, anything supporting 'in' and iteration
+        self.loader = loader
+        self.loaded = {}
+        self.added = set()
+        self.deleted = set()
+
+    def __contains__(self, key):
+        return key in self.loaded or (key in self.source and key not in self.deleted)
+
+    def __getitem__(self, key):
+        if key in self.loaded:
+            return self.loaded[key]
+        if key not in self:
+            raise KeyError(key)
+        value = self.loaded[key] = self.loader(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            if key in self.source:
+                self.deleted.discard(key)
+            else:
+                self.added.add(key)
+        self.loaded[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.loaded.pop(key, None)
+        if key in self.added:
+            self.added.remove(key)
+        else:
+            self.deleted.add(key)
+
+    def __iter__(self):
+        for key in self.source:
+            if key not in self.deleted:
+                yield key
+        yield from (key for key in self.loaded if key in self.added)
+
+    def __len__(self):
+        return len(self.source) - len(self.deleted) + len(self.added)
@@ -0,0 +1,280 @@
+from collections import Counter
+import multiprocessing
+import threading
+import zlib
+import numpy as np
+
+import search
+import matrix
+import kgram
+import tracing
+
+
+# the docs are partitioned between shard processes, each running its own index, while the coordinator keeps the
+# collection-wide statistics: the queries are expanded against the whole vocabulary, and each shard weights its
+# postings with the global df and number of docs, so scores are the same as those of a single index
+
+
+def _terms(shard, doc_id):
+    return list(shard.stats.frequencies[doc_id])
+
+
+def _global_matrix(shard, df, n_docs):  # the postings of the shard, with a row for every term of the collection
+    local = matrix.TermDocumentMatrix.from_statistics(shard.stats)
+    terms = sorted(df)
+    term_ids = {term: row for row, term in enumerate(terms)}
+    lengths = np.zeros(len(terms), dtype='int64')
+    lengths[[term_ids[term] for term in local.terms]] = np.diff(local.indptr)
+    indptr = np.zeros(len(terms) + 1, dtype='int64')
+    np.cumsum(lengths, out=indptr[1:])  # both vocabularies are sorted, so the postings keep their order
+
+    global_matrix = matrix.TermDocumentMatrix(terms, local.doc_ids, indptr, local.indices, local.counts, term_ids=term_ids)
+    global_matrix.idf = np.log10(n_docs / np.maximum(np.fromiter(map(df.__getitem__, terms), dtype='int64', count=len(terms)), 1))
+    return global_matrix
+
+
+class Worker:  # the state of a shard process
+    def __init__(self, name, codec):
+        import index
+
+        self.shard = getattr(index, name)(codec=codec)
+        self.df = Counter()  # of the whole collection, as last sent by the coordinator
+        self.n_docs = 0
+        self.stale = True
+
+    def check(self, doc_ids):  # raises if any of them is taken, before a batch is sent to any shard
+        for doc_id in doc_ids:
+            if self.shard.validate_document(doc_id):
+                raise IndexError(f'Doc-ID <{doc_id}> already exists!')
+
+    def add(self, documents):  # [(doc-id, doc)], either all of them are added or none
+        self.check([doc_id for doc_id, _ in documents])
+        purged = []  # terms of the tombstoned docs replaced by the new ones
+        for doc_id, document in documents:
+            if doc_id in self.shard.tombstones:
+                purged.append(_terms(self.shard, doc_id))
+            self.shard.add_document(document, doc_id=doc_id)
+        self.stale = True
+        return purged
+
+    def remove(self, doc_id, lazy):  # terms of the doc if it is gone for real
+        terms = None if lazy or not self.shard.validate_document(doc_id) else _terms(self.shard, doc_id)
+        self.shard.remove_document(doc_id, lazy=lazy)
+        self.stale = True
+        return terms
+
+    def compact(self):
+        purged = [_terms(self.shard, doc_id) for doc_id in self.shard.tombstones]
+        self.shard.compact()
+        self.stale = True
+        return purged
+
+    def sync(self, df, n_docs):  # the df that changed since the last sync, 0 for the terms gone from the collection
+        for term, count in df.items():
+            if count:
+                self.df[term] = count
+            else:
+                self.df.pop(term, None)
+        self.n_docs = n_docs
+        self.stale = True
+
+    def search(self, queries, k):  # the queries come prepared by the coordinator
+        if self.stale:
+            self.shard._matrix = _global_matrix(self.shard, self.df, self.n_docs)
+            self.shard._changed.clear()  # already in the global matrix, which must not be patched with the local idf
+            self.stale = False
+        return [search._search(self.shard.documents, query, index=self.shard, k=k) for query in queries]
+
+    def fetch(self, doc_id):
+        return self.shard.fetch_document(doc_id)
+
+
+def _serve(connection, name, codec):  # the loop of a shard process: (operation, args) in, (error, result) out
+    worker = Worker(name, codec)
+    while (request := connection.recv()) is not None:
+        operation, args = request
+        try:
+            connection.send((None, getattr(worker, operation)(*args)))
+        except Exception as error:
+            connection.send((error, None))
+
+
+class ShardedIndex:  # a coordinator fanning the searches out to shard processes and merging their top-k
+    def __init__(self, n_shards=2, name='PositionalPosting', codec=None, partition='hash', range_size=100000):
+        # partition: 'hash' spreads the doc-ids, 'range' gives each shard 'range_size' consecutive ones (the last takes the rest)
+        if partition not in ('hash', 'range'):
+            raise ValueError(f'Unknown partition <{partition}>!')
+        self.partition = partition
+        self.range_size = range_size
+        self.df = Counter()  # of the whole collection, tombstoned docs included as in a single index
+        self.n_docs = 0
+        self.changed = set()  # terms whose df the shards have not been sent yet
+        self.synced = True
+        self._doc_counter = 0
+        self._kgrams = None
+        self.tracer = tracing.NULL
+        self.lock = threading.Lock()  # one request at a time on the pipes
+
+        context = multiprocessing.get_context('spawn')
+        self.connections, self.processes = [], []
+        for _ in range(n_shards):
+            connection, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child, name, codec), daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc_info): self.close()
+
+    def close(self):
+        for connection, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                connection.send(None)
+            process.join()
+            connection.close()
+        self.connections, self.processes = [], []
+
+    def shard_of(self, doc_id):
+        n = len(self.connections)
+        if self.partition == 'range':
+            return min((doc_id - 1) // self.range_size, n - 1)
+        return doc_id % n if isinstance(doc_id, int) else zlib.crc32(str(doc_id).encode()) % n
+
+    def _call(self, requests):  # {shard: (operation, args)}, sent to all the shards before any answer is awaited
+        with self.lock:
+            for shard, request in requests.items():
+                self.connections[shard].send(request)
+            answers = {shard: self.connections[shard].recv() for shard in requests}
+        for error, _ in answers.values():
+            if error is not None:
+                raise error
+        return {shard: result for shard, (_, result) in answers.items()}
+
+    def _broadcast(self, operation, *args):
+        return list(self._call({shard: (operation, args) for shard in range(len(self.connections))}).values())
+
+    @property
+    def terms(self): return self.df.keys()
+
+    @property
+    def kgrams(self):  # of the whole vocabulary, for the wildcards
+        if self._kgrams is None:
+            self._kgrams = kgram.KGramIndex()
+            for term in self.df:
+                self._kgrams.add(term)
+        return self._kgrams
+
+    def _count(self, terms, sign):
+        for term in terms:
+            self.df[term] += sign
+            if self.df[term] == 0:
+                del self.df[term]
+                if self._kgrams is not None:
+                    self._kgrams.remove(term)
+            elif sign > 0 and self.df[term] == 1 and self._kgrams is not None:
+                self._kgrams.add(term)
+        self.changed.update(terms)
+        self.n_docs += sign
+        self.synced = False
+
+    def add_document(self, document, doc_id=None):
+        return self.add_documents([document], doc_ids=None if doc_id is None else [doc_id])[0]
+
+    def add_documents(self, documents, doc_ids=None):  # one message per shard for the whole batch
+        documents = list(documents)
+        counter = self._doc_counter
+        if doc_ids is None:
+            doc_ids = list(range(counter + 1, counter + len(documents) + 1))
+            counter += len(documents)
+        doc_ids = list(doc_ids)
+        if len(set(doc_ids)) != len(doc_ids):
+            raise IndexError('Doc-IDs of a batch must be unique!')
+        batches = {}
+        for doc_id, document in zip(doc_ids, documents):
+            batches.setdefault(self.shard_of(doc_id), []).append((doc_id, document))
+
+        # two phases: if any shard would reject its part, none adds anything and the global df stays right
+        self._call({shard: ('check', ([doc_id for doc_id, _ in batch],)) for shard, batch in batches.items()})
+        self._doc_counter = counter
+        for purged in self._call({shard: ('add', (batch,)) for shard, batch in batches.items()}).values():
+            for terms in purged:
+                self._count(terms, -1)
+        for document in documents:
+            self._count(set(document), 1)
+        return doc_ids
+
+    def remove_document(self, doc_id, lazy=False):
+        shard = self.shard_of(doc_id)
+        terms = self._call({shard: ('remove', (doc_id, lazy))})[shard]
+        if terms is not None:
+            self._count(terms, -1)
+
+    def remove_documents(self, doc_ids, lazy=False):
+        for doc_id in doc_ids:
+            self.remove_document(doc_id, lazy=lazy)
+
+    def compact(self):
+        for purged in self._broadcast('compact'):
+            for terms in purged:
+                self._count(terms, -1)
+
+    def fetch_document(self, doc_id):
+        shard = self.shard_of(doc_id)
+        return self._call({shard: ('fetch', (doc_id,))})[shard]
+
+    def _sync(self):  # the shards get the df which changed, so their idf stays that of the whole collection
+        if not self.synced:
+            self._broadcast('sync', {term: self.df.get(term, 0) for term in self.changed}, self.n_docs)
+            self.changed, self.synced = set(), True
+
+    # the queries are prepared here as a single index would do, see search.prepare_query
+
+    def validate_term(self, term):
+        return term in self.df
+
+    def validate_terms(self, terms):
+        for term in terms:
+            if isinstance(term, list):
+                yield list(self.validate_terms(term))
+            elif self.validate_term(term):
+                yield term
+
+    def get_related_terms(self, term, itself=False, where='infix'):
+        terms = getattr(self.kgrams, where)(term)
+        return terms if itself else list(filter(lambda t: t != term, terms))
+
+    def search(self, query, k=None):
+        return self.search_many([query], k=k)[0]
+
+    def search_many(self, queries, k=None):  # each shard ranks its own docs, then the partial rankings are merged
+        search.check_k(k)
+        queries = [search.prepare_query(self, query) for query in queries]
+        self._sync()
+        rankings = self._broadcast('search', queries, k)
+        results = []
+        for partial in zip(*rankings):
+            ranked = sorted(((doc_id, score) for result in partial for doc_id, score in result.items()),
+                            key=lambda item: (-item[1], item[0]))  # ties keep the doc-id order, as in a single index
+            results.append(dict(ranked[:k]))
+        return results
+
+
+if __name__ == "__main__":
+    import index
+
+    documents = [
+        ['hello', 'world'],
+        ['hello', 'my', 'dear'],
+        ['what', 'on', 'world', 'is', 'going'],
+        ['how', 'the', 'world', 'seems', 'for', 'you']
+    ]
+    queries = [['hello'], ['world', 'going'], ['"my', 'dear"'], ['wor*']]
+
+    single = index.PositionalPosting()
+    single.add_documents(documents)
+    with ShardedIndex(n_shards=2) as sharded:
+        sharded.add_documents(documents)
+        for query in queries:
+            print(query, sharded.search(query, k=3), single.search(query, k=3))
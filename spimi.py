@@ -0,0 +1,181 @@
+from collections import defaultdict
+from operator import itemgetter
+import itertools
+import tempfile
+import shutil
+import pickle
+import heapq
+import os
+import numpy as np
+
+import segment
+
+
+MEMORY = 64 * 2**20  # bytes a block may take before it is flushed as a run
+
+# rough sizes of the python objects of a block, enough to keep the peak memory predictable
+TERM_SIZE = 160
+POSTING_SIZE = 160
+POSITION_SIZE = 36
+
+CHUNK = 2**20  # postings scored at once while computing the norms and upper bounds
+
+
+def _chunks(indptr):  # (first term, term after the last, slice of their postings), about CHUNK postings at a time
+    start, n_terms = 0, len(indptr) - 1
+    while start < n_terms:
+        stop = max(start + 1, int(np.searchsorted(indptr, indptr[start] + CHUNK, side='right')) - 1)
+        yield start, stop, slice(indptr[start], indptr[stop])
+        start = stop
+
+
+def _write_run(block, filepath):
+    with open(filepath, 'wb') as handler:
+        for term in sorted(block):
+            pickle.dump((term, block[term]), handler, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read(filepath):
+    with open(filepath, 'rb') as handler:
+        while True:
+            try:
+                yield pickle.load(handler)
+            except EOFError:
+                return
+
+
+def invert(documents, directory, memory=MEMORY):  # writes sorted runs of term -> {doc-id: positions}, one per full block
+    runs, lengths = [], []
+    block, size = defaultdict(dict), 0
+    with open(os.path.join(directory, 'documents.tmp'), 'wb') as handler:
+        for doc_id, document in enumerate(documents, start=1):
+            document = list(document)
+            pickle.dump(document, handler, protocol=pickle.HIGHEST_PROTOCOL)
+            lengths.append(len(document))
+            for position, term in enumerate(document):
+                if term not in block:
+                    size += TERM_SIZE
+                postings = block[term]
+                if doc_id not in postings:
+                    postings[doc_id] = []
+                    size += POSTING_SIZE
+                postings[doc_id].append(position)
+                size += POSITION_SIZE
+
+            if size >= memory:
+                runs.append(os.path.join(directory, f'run-{len(runs)}.tmp'))
+                _write_run(block, runs[-1])
+                block, size = defaultdict(dict), 0
+
+    if block:
+        runs.append(os.path.join(directory, f'run-{len(runs)}.tmp'))
+        _write_run(block, runs[-1])
+    return runs, lengths
+
+
+def merge(runs, directory, path):  # k-way merge of the runs into the postings of the segment, returns its offsets table
+    dictionary = [(0, 0, 0)]
+    tf_path = os.path.join(directory, 'tf.tmp')
+    with open(os.path.join(path, 'terms.bin'), 'wb') as terms_handler, \
+            open(os.path.join(path, 'postings.bin'), 'wb') as postings_handler, \
+            open(os.path.join(path, 'positions.bin'), 'wb') as positions_handler, \
+            open(tf_path, 'wb') as tf_handler:
+        merged = heapq.merge(*map(_read, runs), key=itemgetter(0))  # runs of the same term come in doc-id order
+        for term, group in itertools.groupby(merged, key=itemgetter(0)):
+            doc_ids, tf, positions = [], [], []
+            for _, postings in group:
+                for doc_id, term_positions in postings.items():
+                    doc_ids.append(doc_id)
+                    tf.append(len(term_positions))
+                    positions.extend(term_positions)
+
+            encoded = term.encode()
+            terms_handler.write(encoded)
+            postings_handler.write((np.asarray(doc_ids, dtype='<u4') - 1).tobytes())  # doc-ids are 1..n, columns 0..n-1
+            tf_handler.write(np.asarray(tf, dtype='<u4').tobytes())
+            positions_handler.write(np.asarray(positions, dtype='<u4').tobytes())
+            last = dictionary[-1]
+            dictionary.append((last[0] + len(encoded), last[1] + len(doc_ids), last[2] + len(positions)))
+
+    with open(os.path.join(path, 'postings.bin'), 'ab') as postings_handler, open(tf_path, 'rb') as tf_handler:
+        shutil.copyfileobj(tf_handler, postings_handler)
+    with open(os.path.join(path, 'dictionary.bin'), 'wb') as handler:
+        handler.write(np.asarray(dictionary, dtype='<i8').tobytes())
+    return np.asarray(dictionary, dtype='int64')
+
+
+def build(documents, path, name='PositionalPosting', codec=None, memory=MEMORY, tmpdir=None):
+    # written aside then swapped in, as segment.write does: a loaded index may be reading the segment it replaces
+    path = os.path.normpath(path)
+    shutil.rmtree(path + '.tmp', ignore_errors=True)
+    _build(documents, path + '.tmp', name=name, codec=codec, memory=memory, tmpdir=tmpdir)
+    segment.replace(path + '.tmp', path)
+
+
+def _build(documents, path, name, codec, memory, tmpdir):
+    os.makedirs(path, exist_ok=True)
+    directory = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        runs, lengths = invert(documents, directory, memory=memory)
+        dictionary = merge(runs, directory, path)
+        n_docs, n_terms = len(lengths), len(dictionary) - 1
+        n_postings, n_tokens = int(dictionary[-1, 1]), int(dictionary[-1, 2])
+
+        with open(os.path.join(path, 'terms.bin'), 'rb') as handler:
+            blob = handler.read()
+        offsets = dictionary[:, 0].tolist()
+        term_ids = {blob[start:stop].decode(): i for i, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:]))}
+        idf = np.log10(n_docs / np.maximum(np.diff(dictionary[:, 1]), 1))
+
+        # documents are streamed back once more, to store them as term-ids
+        with open(os.path.join(path, 'documents.bin'), 'wb') as handler:
+            handler.write(np.arange(1, n_docs + 1, dtype='<i8').tobytes())
+            handler.write(np.concatenate(([0], np.cumsum(lengths, dtype='int64'))).astype('<i8').tobytes())
+            for document in _read(os.path.join(directory, 'documents.tmp')):
+                handler.write(np.fromiter(map(term_ids.get, document), dtype='<u4', count=len(document)).tobytes())
+
+        # norms then upper bounds are computed over a bounded chunk of postings at a time; the squared weights are
+        # summed in postings order, as the bincount of TermDocumentMatrix.norms does, so the norms are the same to the bit
+        norms = np.zeros(n_docs, dtype='float64')
+        upper_bounds = np.zeros(n_terms, dtype='float64')
+        if n_postings:
+            columns = np.memmap(os.path.join(path, 'postings.bin'), dtype='<u4', mode='r', shape=(n_postings,))
+            frequencies = np.memmap(os.path.join(path, 'postings.bin'), dtype='<u4', mode='r', shape=(n_postings,), offset=4*n_postings)
+            indptr = dictionary[:, 1]
+
+            def weights(start, stop, s):
+                rows = np.repeat(np.arange(start, stop), np.diff(indptr[start:stop + 1]))
+                return (1 + np.log10(frequencies[s].astype('float64'))) * idf[rows]
+
+            for start, stop, s in _chunks(indptr):
+                np.add.at(norms, columns[s], weights(start, stop, s) ** 2)  # unbuffered, so in postings order
+            norms = np.sqrt(norms)
+            for start, stop, s in _chunks(indptr):
+                doc_norms = norms[columns[s]]
+                normalized = np.divide(weights(start, stop, s), doc_norms, out=np.zeros(s.stop - s.start), where=doc_norms != 0)
+                upper_bounds[start:stop] = np.maximum.reduceat(normalized, indptr[start:stop] - indptr[start])
+            del columns, frequencies
+
+        with open(os.path.join(path, 'scores.bin'), 'wb') as handler:
+            handler.write(norms.astype('<f8').tobytes())
+            handler.write(upper_bounds.astype('<f8').tobytes())
+        segment.write_meta(
+            path, name, codec, n_docs,
+            n_terms=n_terms, n_postings=n_postings, n_tokens=n_tokens, n_docs=n_docs
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import random
+
+    random.seed(0)
+    vocabulary = [f'term{i}' for i in range(1000)]
+    documents = (random.choices(vocabulary, k=random.randint(5, 50)) for _ in range(10000))  # any iterator works
+
+    with tempfile.TemporaryDirectory() as path:
+        build(documents, path, memory=2**20)
+        seg = segment.Segment(path)
+        print('Meta:', seg.meta)
+        print('term0 df:', len(seg.postings('term0')[0]))
+        seg.close()
@@ -0,0 +1,86 @@
+from collections import Counter
+import numpy as np
+
+
+class Statistics:
+    def __init__(self):
+        self.df = Counter()  # term -> number of documents containing it
+        self.cf = Counter()  # term -> number of occurrences in the whole collection
+        self.lengths = {}  # doc-id -> number of tokens
+        self.frequencies = {}  # doc-id -> Counter of its terms
+        self._norms = {}
+
+    def __len__(self): return len(self.lengths)
+
+    def __contains__(self, doc_id): return doc_id in self.lengths
+
+    @property
+    def n_docs(self): return len(self.lengths)
+
+    def add(self, doc_id, document):
+        frequencies = Counter(document)
+        self.frequencies[doc_id] = frequencies
+        self.lengths[doc_id] = len(document)
+        self.df.update(frequencies.keys())
+        self.cf.update(frequencies)
+        self._norms.clear()  # idf of every term depends on the number of docs
+
+    def remove(self, doc_id):
+        frequencies = self.frequencies.pop(doc_id)
+        del self.lengths[doc_id]
+        for term, count in frequencies.items():
+            self.df[term] -= 1
+            self.cf[term] -= count
+            if self.df[term] == 0:
+                del self.df[term], self.cf[term]
+        self._norms.clear()
+        return frequencies
+
+    def merge(self, other):  # other must hold different docs
+        self.df.update(other.df)
+        self.cf.update(other.cf)
+        self.lengths.update(other.lengths)
+        self.frequencies.update(other.frequencies)
+        self._norms.clear()
+
+    def document_frequency(self, term):
+        return self.df.get(term, 0)
+
+    def collection_frequency(self, term):
+        return self.cf.get(term, 0)
+
+    def term_frequency(self, doc_id, term):
+        return self.frequencies[doc_id].get(term, 0)
+
+    def inverse_document_frequency(self, term):
+        return np.log10(len(self) / self.df[term])
+
+    def length(self, doc_id):
+        return self.lengths[doc_id]
+
+    def norm(self, doc_id):  # length of the tf-idf vector of the doc, cached until the collection changes
+        if doc_id not in self._norms:
+            weights = np.fromiter(
+                ((1 + np.log10(tf)) * self.inverse_document_frequency(term) for term, tf in self.frequencies[doc_id].items()),
+                'float64'
+            )
+            self._norms[doc_id] = np.sqrt(np.sum(weights ** 2))
+        return self._norms[doc_id]
+
+
+if __name__ == "__main__":
+    documents = [
+        ['hello', 'world'],
+        ['hello', 'my', 'dear'],
+        ['what', 'on', 'world', 'is', 'going', 'on']
+    ]
+
+    statistics = Statistics()
+    for doc_id, document in enumerate(documents, start=1):
+        statistics.add(doc_id, document)
+
+    print('N:', len(statistics))
+    print('df(world):', statistics.document_frequency('world'))
+    print('cf(on):', statistics.collection_frequency('on'))
+    print('idf(hello):', statistics.inverse_document_frequency('hello'))
+    print('norm(3):', statistics.norm(3))
@@ -0,0 +1,30 @@
+import pickle
+
+import benchmark
+import compress
+import index
+
+
+def test_packed_list():
+    packed = compress.PackedList([5, 1, 300, 300, 20000])
+    assert list(packed) == [1, 5, 300, 300, 20000] and len(packed) == 5 and packed.last == 20000
+    assert 300 in packed and 7 not in packed
+    assert packed.appended(20000) == [1, 5, 300, 300, 20000, 20000]
+    assert packed.appended(3) == [1, 3, 5, 300, 300, 20000]  # out of order
+    assert pickle.loads(pickle.dumps(packed)) == packed
+    assert not compress.PackedList() and compress.PackedList().appended(4) == [4]
+
+
+def test_codecs_shrink_the_postings():
+    documents = benchmark.corpus(150)
+    queries = [document[:2] for document in documents[:30]]
+    for cls in [index.NonPositionalPosting, index.PositionalPosting, index.PositionalGraph]:
+        plain = cls()
+        plain.add_documents(documents)
+        for codec in compress.CODECS:
+            compressed = cls(codec=codec)
+            compressed.add_documents(documents)
+            compressed.add_document(documents[0], doc_id=100000)
+            compressed.remove_document(100000)
+            assert compressed.memory_usage()['postings'] < plain.memory_usage()['postings'], (cls, codec)
+            assert [compressed.search(query) for query in queries] == [plain.search(query) for query in queries]
@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+
+import index
+import matrix
+
+
+def same_matrix(patched, built):
+    assert patched.terms == built.terms
+    for name in ['doc_ids', 'indptr', 'indices', 'counts', 'norms', 'upper_bounds']:
+        assert np.array_equal(getattr(patched, name), getattr(built, name)), name
+
+
+def test_removed_term_comes_back():
+    positional = index.PositionalPosting()
+    positional.add_documents([['hello'], ['world']])
+    positional.search(['world'])
+    positional.remove_document(1)
+    positional.add_document(['hello'])
+    assert positional.search(['hello']).keys() == {3}
+    same_matrix(positional.matrix, matrix.TermDocumentMatrix.from_statistics(positional.stats))
+
+
+def test_patched_matrix_is_the_built_one():
+    rng = random.Random(0)
+    words = [f'w{i}' for i in range(12)]
+    for _ in range(100):
+        positional = index.PositionalPosting()
+        positional.add_documents([rng.choices(words, k=rng.randint(1, 4)) for _ in range(4)])
+        positional.search(['w1'])
+        for _ in range(6):
+            alive = [doc_id for doc_id in positional.documents if doc_id not in positional.tombstones]
+            if alive and rng.random() < 0.4:
+                positional.remove_document(rng.choice(alive))
+            elif alive and rng.random() < 0.3:
+                positional.remove_document(rng.choice(alive), lazy=True)
+                positional.compact()
+            else:
+                positional.add_document(rng.choices(words, k=rng.randint(1, 4)))
+            if rng.random() < 0.5:  # a few changes at once, or a single one
+                continue
+            positional.search(['w2'])
+            same_matrix(positional.matrix, matrix.TermDocumentMatrix.from_statistics(positional.stats))
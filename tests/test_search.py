@@ -0,0 +1,38 @@
+import pytest
+
+import index
+
+DOCUMENTS = [
+    ['hello', 'world'],
+    ['hello', 'my', 'dear'],
+    ['what', 'on', 'world', 'is', 'going'],
+    ['how', 'the', 'world', 'seems', 'for', 'you']
+]
+
+
+@pytest.mark.parametrize('cls', [index.PositionalPosting, index.NonPositionalPosting, index.CompactPositionalPosting])
+def test_no_docs_for_k_0(cls):
+    positional = cls()
+    positional.add_documents(DOCUMENTS)
+    assert positional.search(['hello', 'world'], k=0) == {}
+    assert positional.search_many([['hello'], ['world']], k=0) == [{}, {}]
+    if positional.is_positional:
+        assert positional.search(['world', '"my', 'dear"'], k=0) == {}
+    positional.tiered()
+    assert positional.search(['hello', 'world'], k=0) == {}
+
+
+def test_negative_k():
+    positional = index.PositionalPosting()
+    positional.add_documents(DOCUMENTS)
+    with pytest.raises(ValueError):
+        positional.search(['hello'], k=-1)
+    with pytest.raises(ValueError):
+        positional.search_many([['hello']], k=-1)
+
+
+def test_phrase_opening_the_query():
+    positional = index.PositionalPosting()
+    positional.add_documents(DOCUMENTS)
+    assert positional.search(['"my', 'dear"']).keys() == {2}
+    assert positional.search(['"hello', 'world"']).keys() == {1}
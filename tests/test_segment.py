@@ -0,0 +1,27 @@
+import pickle
+import shutil
+
+import pytest
+
+import benchmark
+import index
+
+
+@pytest.mark.parametrize('cls', [index.PositionalPosting, index.PositionalGraph])
+def test_copy_outlives_the_segment_path(tmp_path, cls):
+    documents = benchmark.corpus(200)
+    path = str(tmp_path / 'segment')
+    positional = cls()
+    positional.add_documents(documents)
+    positional.save(path)
+    loaded = index.Index.load(path)
+    query = documents[3][:2]
+    results = loaded.search(query, k=5)
+    assert pickle.loads(pickle.dumps(loaded)).get_term(documents[0][0]) == loaded.get_term(documents[0][0])
+
+    cls.build(iter(documents[:5]), path)  # another segment at the same path
+    assert pickle.loads(pickle.dumps(loaded)).search(query, k=5) == results
+    shutil.rmtree(path)
+    copy = pickle.loads(pickle.dumps(loaded))
+    assert copy.search(query, k=5) == results
+    assert copy.get_term(documents[0][0]) == loaded.get_term(documents[0][0])
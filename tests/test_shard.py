@@ -0,0 +1,14 @@
+import benchmark
+import index
+import shard
+
+
+def test_same_scores_as_a_single_index():
+    documents = benchmark.corpus(2000)
+    queries = [document[:3] for document in documents[:200]] + benchmark.queries(documents, 100, 'quoted')
+    single = index.PositionalPosting()
+    single.add_documents(documents)
+    with shard.ShardedIndex(n_shards=3) as sharded:
+        sharded.add_documents(documents)
+        for k in [10, None]:  # bit for bit, not only the same ranking
+            assert sharded.search_many(queries, k=k) == [single.search(query, k=k) for query in queries]
@@ -0,0 +1,30 @@
+import filecmp
+import os
+
+import benchmark
+import index
+import segment
+import spimi
+
+
+def test_build_is_the_saved_segment(tmp_path, monkeypatch):
+    documents = benchmark.corpus(500)
+    monkeypatch.setattr(spimi, 'CHUNK', 1000)  # several chunks of postings
+    index.PositionalPosting.build(iter(documents), str(tmp_path / 'built'), memory=2**18)
+    positional = index.PositionalPosting()
+    positional.add_documents(documents)
+    positional.save(str(tmp_path / 'saved'))
+    for name in segment.FILES:
+        assert filecmp.cmp(tmp_path / 'built' / f'{name}.bin', tmp_path / 'saved' / f'{name}.bin', shallow=False), name
+
+
+def test_build_onto_a_loaded_segment(tmp_path):
+    documents = benchmark.corpus(300)
+    path = str(tmp_path / 'segment')
+    index.PositionalPosting.build(iter(documents), path)
+    loaded = index.Index.load(path)
+    results = loaded.search(documents[5][:2], k=5)
+    index.PositionalPosting.build(iter(documents[:10]), path)
+    assert loaded.search(documents[5][:2], k=5) == results  # still reads the segment it loaded
+    assert len(index.Index.load(path).documents) == 10
+    assert os.listdir(tmp_path) == ['segment']
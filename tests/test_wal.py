@@ -0,0 +1,57 @@
+import os
+
+import index
+
+
+def test_reopened_twice_keeps_every_change(tmp_path):
+    directory = str(tmp_path)
+    positional = index.PositionalPosting.open(directory, fsync=False)
+    positional.add_document(['one'])
+    positional.close()
+
+    positional = index.PositionalPosting.open(directory, fsync=False)
+    positional.add_document(['two'])
+    positional.remove_document(1, lazy=True)
+    positional.close()
+
+    positional = index.PositionalPosting.open(directory, fsync=False)
+    assert dict(positional.documents) == {1: ['one'], 2: ['two']}
+    assert positional.tombstones == {1}
+    assert positional.search(['two']).keys() == {2}
+    assert sorted(entry for entry in os.listdir(directory) if entry.startswith('log-')) == ['log-000000000000.jsonl']
+    positional.close()
+
+
+def test_checkpoint_after_reopen(tmp_path):
+    directory = str(tmp_path)
+    positional = index.PositionalPosting.open(directory, fsync=True)
+    positional.add_documents([['one'], ['two']])
+    positional.close()
+
+    positional = index.PositionalPosting.open(directory, fsync=True)
+    positional.checkpoint()
+    positional.add_document(['three'])
+    positional.close()
+
+    positional = index.PositionalPosting.open(directory)
+    assert dict(positional.documents) == {1: ['one'], 2: ['two'], 3: ['three']}
+    assert positional.add_document(['four']) == 4
+    positional.close()
+
+
+def test_checkpoint_keeps_the_snapshot_being_read(tmp_path):
+    directory = str(tmp_path)
+    positional = index.PositionalPosting.open(directory, fsync=False)
+    positional.add_documents([['hello', 'world'], ['hello', 'my', 'dear']])
+    positional.checkpoint()
+    positional.close()
+
+    positional = index.PositionalPosting.open(directory, fsync=False)
+    positional.add_document(['what', 'on', 'world', 'is', 'going'])
+    positional.checkpoint()
+    assert sorted(entry for entry in os.listdir(directory) if entry.startswith('snapshot-')) == [
+        'snapshot-000000000002', 'snapshot-000000000003'
+    ]
+    queries = [['hello'], ['world'], ['dear']]
+    assert positional.search_many(queries, workers=2, processes=True) == positional.search_many(queries)
+    positional.close()
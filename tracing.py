@@ -0,0 +1,142 @@
+from contextlib import contextmanager, nullcontext
+from collections import Counter, deque
+import threading
+import time
+
+
+_NOTHING = nullcontext()
+
+
+class NullTracer:  # instrumentation turned off, every hook does nothing
+    enabled = False
+
+    def stage(self, name): return _NOTHING
+
+    def query(self, query): return _NOTHING
+
+    def count(self, name, n=1): pass
+
+
+NULL = NullTracer()
+
+
+class QueryTrace:  # what one search spent, stage by stage
+    def __init__(self, query):
+        self.query = query
+        self.seconds = 0.0
+        self.stages = Counter()  # stage -> seconds
+        self.counters = Counter()
+
+    def __repr__(self):
+        stages = ', '.join(f'{name}={1000*seconds:.3f}ms' for name, seconds in self.stages.items())
+        return f'{type(self).__name__}({self.query!r}, {1000*self.seconds:.3f}ms, {stages}, {dict(self.counters)})'
+
+
+class Tracer(NullTracer):  # stage timers and counters, in total and per query, with a log of the slow queries
+    enabled = True
+
+    def __init__(self, slow_ms=None, log_size=100, callbacks=()):
+        self.slow_ms = slow_ms  # queries slower than this are kept in 'slow_queries', None keeps none
+        self.slow_queries = deque(maxlen=log_size)
+        self.callbacks = list(callbacks)  # called with the QueryTrace of every finished query
+        self.lock = threading.Lock()
+        self.local = threading.local()  # the query being traced by each thread
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.n_queries = 0
+            self.seconds = 0.0
+            self.timings = Counter()  # stage -> seconds
+            self.calls = Counter()  # stage -> number of runs
+            self.counters = Counter()
+            self.slow_queries.clear()
+
+    def subscribe(self, callback):  # usable as a decorator
+        self.callbacks.append(callback)
+        return callback
+
+    def _current(self):
+        return getattr(self.local, 'trace', None)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.timings[name] += elapsed
+                self.calls[name] += 1
+            trace = self._current()
+            if trace is not None:
+                trace.stages[name] += elapsed
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+        trace = self._current()
+        if trace is not None:
+            trace.counters[name] += n
+
+    @contextmanager
+    def query(self, query):
+        if self._current() is not None:  # a query inside another one is a part of it
+            yield self._current()
+            return
+
+        trace = self.local.trace = QueryTrace(query)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.seconds = time.perf_counter() - start
+            self.local.trace = None
+            with self.lock:
+                self.n_queries += 1
+                self.seconds += trace.seconds
+                if self.slow_ms is not None and 1000 * trace.seconds >= self.slow_ms:
+                    self.slow_queries.append(trace)
+            for callback in self.callbacks:
+                callback(trace)
+
+    def report(self):  # totals so far, times in milliseconds
+        with self.lock:
+            return {
+                'queries': self.n_queries,
+                'total_ms': 1000 * self.seconds,
+                'stages': {
+                    name: {'calls': self.calls[name], 'total_ms': 1000 * seconds, 'mean_ms': 1000 * seconds / self.calls[name]}
+                    for name, seconds in self.timings.most_common()
+                },
+                'counters': dict(self.counters),
+                'slow_queries': len(self.slow_queries),
+            }
+
+    def __getstate__(self):  # locks and callbacks stay with the process that made them
+        state = self.__dict__.copy()
+        del state['lock'], state['local']
+        state['callbacks'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+if __name__ == "__main__":
+    tracer = Tracer(slow_ms=5)
+    tracer.subscribe(print)
+
+    for query in [['fast'], ['slow']]:
+        with tracer.query(query):
+            with tracer.stage('preprocess'):
+                time.sleep(0.001)
+            with tracer.stage('scoring'):
+                time.sleep(0.01 if query == ['slow'] else 0.001)
+                tracer.count('candidates', 42)
+
+    print(tracer.report())
+    print('Slow:', list(tracer.slow_queries))
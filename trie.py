@@ -0,0 +1,185 @@
+from collections.abc import MutableMapping
+
+
+class _Unloaded:  # pickled by name, so that a copy of the trie still tells the values it has not read
+    def __reduce__(self): return 'UNLOADED'
+
+
+UNLOADED = _Unloaded()  # placeholder of a value which the loader of the trie has not read yet
+
+
+class Node:  # one edge of the radix trie, 'value' is None unless the path up to here is a term
+    __slots__ = ('label', 'children', 'value')
+
+    def __init__(self, label, value=None, children=None):
+        self.label = label
+        self.value = value
+        self.children = children  # first char of the child's label -> child, None for leaves
+
+
+class RadixTrie(MutableMapping):  # term -> value, single-child chains are merged into one edge
+    def __init__(self, items=(), loader=None):
+        self.root = Node('')
+        self.loader = loader  # term -> value, for the values set to UNLOADED
+        self.size = 0
+        for term, value in dict(items).items():
+            self[term] = value
+
+    @classmethod
+    def fromkeys(cls, terms, loader):  # every value is read by 'loader' on first access
+        return cls(dict.fromkeys(terms, UNLOADED), loader=loader)
+
+    def _walk(self, term):  # the nodes along the path of 'term', or None if it is not in the trie
+        path, node, i = [self.root], self.root, 0
+        while i < len(term):
+            node = node.children.get(term[i]) if node.children else None
+            if node is None or not term.startswith(node.label, i):
+                return None
+            path.append(node)
+            i += len(node.label)
+        return path
+
+    def _node(self, term):  # the node of 'term', or None
+        node, i, n = self.root, 0, len(term)
+        while i < n:
+            children = node.children
+            if children is None:
+                return None
+            node = children.get(term[i])
+            if node is None:
+                return None
+            label = node.label
+            if not term.startswith(label, i):
+                return None
+            i += len(label)
+        return node
+
+    def _value(self, term, node):
+        if node.value is UNLOADED:
+            node.value = self.loader(term)
+        return node.value
+
+    def __contains__(self, term):
+        node = self._node(term)
+        return node is not None and node.value is not None
+
+    def __getitem__(self, term):
+        node = self._node(term)
+        if node is None or node.value is None:
+            raise KeyError(term)
+        return self._value(term, node)
+
+    def get(self, term, default=None):
+        node = self._node(term)
+        if node is None or node.value is None:
+            return default
+        return self._value(term, node)
+
+    def __setitem__(self, term, value):
+        if value is None:
+            raise ValueError('None marks the inner nodes, it can not be stored!')
+        node, i = self.root, 0
+        while i < len(term):
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(term[i])
+            if child is None:  # a new leaf holding the rest of the term
+                node.children[term[i]] = Node(term[i:], value)
+                self.size += 1
+                return
+
+            label, common = child.label, 1
+            while common < len(label) and i + common < len(term) and label[common] == term[i + common]:
+                common += 1
+            if common < len(label):  # the edge is split where the term leaves it
+                middle = Node(label[:common], children={label[common]: child})
+                child.label = label[common:]
+                node.children[term[i]] = child = middle
+            node, i = child, i + common
+
+        if node.value is None:
+            self.size += 1
+        node.value = value
+
+    def __delitem__(self, term):
+        path = self._walk(term)
+        if path is None or path[-1].value is None:
+            raise KeyError(term)
+        node = path[-1]
+        node.value = None
+        self.size -= 1
+
+        if node is self.root:
+            return
+        parent = path[-2]
+        if not node.children:  # an empty leaf is dropped
+            del parent.children[node.label[0]]
+            if not parent.children:
+                parent.children = None
+            node = parent
+            parent = path[-3] if len(path) > 2 else None
+        if parent is not None and node.value is None and node.children and len(node.children) == 1:
+            child, = node.children.values()  # a chain left behind is merged back into one edge
+            child.label = node.label + child.label
+            parent.children[child.label[0]] = child
+
+    def _items(self, node, prefix):  # (term, node) of every term under 'node', in sorted order
+        stack = [(prefix, node)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.value is not None:
+                yield prefix, node
+            if node.children:
+                for char in sorted(node.children, reverse=True):
+                    child = node.children[char]
+                    stack.append((prefix + child.label, child))
+
+    def _prefix_node(self, prefix):  # the highest node whose path starts with 'prefix', and that path
+        node, i = self.root, 0
+        while i < len(prefix):
+            node = node.children.get(prefix[i]) if node.children else None
+            if node is None:
+                return None, None
+            label = node.label
+            if prefix.startswith(label, i):
+                i += len(label)
+            elif label.startswith(prefix[i:]):  # the prefix ends inside this edge
+                return node, prefix[:i] + label
+            else:
+                return None, None
+        return node, prefix
+
+    def prefix(self, prefix):  # sorted terms starting with 'prefix'
+        node, path = self._prefix_node(prefix)
+        if node is None:
+            return []
+        return [term for term, _ in self._items(node, path)]
+
+    def items_with_prefix(self, prefix):
+        node, path = self._prefix_node(prefix)
+        if node is None:
+            return
+        for term, node in self._items(node, path):
+            yield term, self._value(term, node)
+
+    def __iter__(self):
+        for term, _ in self._items(self.root, ''):
+            yield term
+
+    def __len__(self): return self.size
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self)} terms)'
+
+
+if __name__ == "__main__":
+    terms = ['hello', 'help', 'helps', 'shell', 'world', 'word', 'sword', 'book', 'took', 'okay']
+
+    trie = RadixTrie((term, len(term)) for term in terms)
+    print('Terms:', list(trie))
+    print('Root edges:', {char: node.label for char, node in trie.root.children.items()})
+    print('Edges under <hel>:', {char: node.label for char, node in trie.root.children['h'].children.items()})
+    print('Prefix (hel):', trie.prefix('hel'))
+    print('Prefix (wor):', trie.prefix('wor'))
+    del trie['help']
+    print('Without <help>:', trie.prefix('hel'), '| edge:', trie.root.children['h'].children['p'].label)
@@ -0,0 +1,180 @@
+import shutil
+import json
+import os
+
+
+# <directory>/CURRENT           json: name and sequence number of the latest snapshot
+# <directory>/snapshot-<seq>/   a segment (see segment.write) of the index after the first <seq> operations
+# <directory>/log-<seq>.jsonl   the operations after it, one json record per line
+
+
+def name(kind, seq):
+    return f'{kind}-{seq:012d}' + ('.jsonl' if kind == 'log' else '')
+
+
+def read_current(directory):  # None if no snapshot was ever made
+    path = os.path.join(directory, 'CURRENT')
+    if not os.path.exists(path):
+        return None
+    with open(path) as handler:
+        return json.load(handler)
+
+
+def write_current(directory, current):  # written aside then renamed, a crash leaves the old or the new one
+    path = os.path.join(directory, 'CURRENT')
+    with open(path + '.tmp', 'w') as handler:
+        json.dump(current, handler)
+        handler.flush()
+        os.fsync(handler.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def read(path):  # the records of a log, a torn last line (a crash while appending) is cut off
+    records, good = [], 0
+    if not os.path.exists(path):
+        return records
+    with open(path, 'rb') as handler:
+        for line in handler:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                records.pop()
+                break
+            good += len(line)
+    if good != os.path.getsize(path):
+        with open(path, 'r+b') as handler:
+            handler.truncate(good)
+    return records
+
+
+def sync_directory(path):  # makes the files created, renamed or removed in it durable
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def sync_tree(path):  # every file under 'path', then the directories themselves
+    for root, _, names in os.walk(path):
+        for entry in names:
+            with open(os.path.join(root, entry), 'rb') as handler:
+                os.fsync(handler.fileno())
+        sync_directory(root)
+
+
+class WriteAheadLog:  # appends the changes of an index, so that persisting costs as much as the change itself
+    def __init__(self, directory, base=0, seq=None, fsync=True, checkpoint_every=10000):
+        self.directory = directory
+        self.base = base  # seq of the snapshot the log follows, which names its file
+        self.seq = base if seq is None else seq  # number of the last operation written
+        self.fsync = fsync  # False: flushed to the OS only, a power loss (not a crash) may lose the tail
+        self.checkpoint_every = checkpoint_every  # operations between snapshots, None: only on 'checkpoint'
+        self.since_checkpoint = self.seq - base
+        self.handler = open(os.path.join(directory, name('log', base)), 'ab')
+
+    def append(self, op, **fields):
+        self.seq += 1
+        self.since_checkpoint += 1
+        self.handler.write(json.dumps({'seq': self.seq, 'op': op, **fields}).encode() + b'\n')
+        self.handler.flush()
+        if self.fsync:
+            os.fsync(self.handler.fileno())
+
+    @property
+    def due(self):  # a snapshot is due, the log has grown enough since the last one
+        return self.checkpoint_every is not None and self.since_checkpoint >= self.checkpoint_every
+
+    def rotate(self):  # starts the log after a snapshot of the first 'seq' operations
+        self.handler.close()
+        self.base = self.seq
+        self.handler = open(os.path.join(self.directory, name('log', self.base)), 'ab')
+        self.since_checkpoint = 0
+
+    def close(self):
+        self.handler.close()
+
+
+def checkpoint(index, directory):  # a snapshot of the index, then the log starts over and the older files are dropped
+    wal, seq = index.wal, index.wal.seq
+    index.save(os.path.join(directory, name('snapshot', seq)))
+    if wal.fsync:  # the snapshot must be on disk before CURRENT points at it
+        sync_tree(os.path.join(directory, name('snapshot', seq)))
+        sync_directory(directory)
+    write_current(directory, {'snapshot': name('snapshot', seq), 'seq': seq})
+    wal.rotate()
+    if wal.fsync:  # the rename of CURRENT and the new log, before the old files go
+        sync_directory(directory)
+    # the snapshot the index was loaded from stays while the index reads it lazily, a later checkpoint drops it
+    reading = None if index._segment is None else os.path.basename(index._segment.path)
+    for entry in os.listdir(directory):
+        if entry.startswith(('snapshot-', 'log-')) and entry not in (name('snapshot', seq), name('log', seq), reading):
+            path = os.path.join(directory, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def replay(index, records):
+    for record in records:
+        if record['op'] == 'add':
+            index.add_document(record['document'], doc_id=record['doc_id'])
+            index._doc_counter = record['counter']
+        elif record['op'] == 'remove':
+            index.remove_document(record['doc_id'], lazy=record['lazy'])
+        elif record['op'] == 'purge':
+            for doc_id in record['doc_ids']:
+                if doc_id in index.tombstones:
+                    index._purge(doc_id)
+        else:
+            raise ValueError(f"Unknown operation <{record['op']}> in the log!")
+
+
+def recover(cls, directory, codec=None, fsync=True, checkpoint_every=10000):  # the latest snapshot, with the log tail replayed
+    os.makedirs(directory, exist_ok=True)
+    current = read_current(directory)
+    if current is None:
+        index = cls(codec=codec)
+        seq = 0
+    else:
+        index = cls.load(os.path.join(directory, current['snapshot']))
+        seq = current['seq']
+
+    records = read(os.path.join(directory, name('log', seq)))
+    replay(index, records)
+    index.wal = WriteAheadLog(  # the log goes on where it stopped, in the file of the current snapshot
+        directory, base=seq, seq=records[-1]['seq'] if records else seq, fsync=fsync, checkpoint_every=checkpoint_every
+    )
+    if current is None:
+        index.checkpoint()
+    return index
+
+
+if __name__ == "__main__":
+    import tempfile
+    import index
+
+    documents = [
+        ['hello', 'world'],
+        ['hello', 'my', 'dear'],
+        ['what', 'on', 'world', 'is', 'going'],
+        ['how', 'the', 'world', 'seems', 'for', 'you']
+    ]
+
+    directory = tempfile.mkdtemp()
+    positional = index.PositionalPosting.open(directory)
+    positional.add_documents(documents[:2])
+    positional.checkpoint()
+    positional.add_documents(documents[2:])
+    positional.remove_document(2)
+    positional.close()  # as if it crashed: the last changes are only in the log
+
+    print('Files:', sorted(os.listdir(directory)))
+    recovered = index.PositionalPosting.open(directory)
+    print('Recovered docs:', recovered.documents.keys() == positional.documents.keys(), list(recovered.documents))
+    print('Same results:', recovered.search(['world']) == positional.search(['world']))
+    recovered.close()
+    shutil.rmtree(directory)